@@ -1,19 +1,76 @@
 import os
-from supabase import create_client, Client
+import logging
+import threading
+import time
+from collections import OrderedDict
+
 from dotenv import load_dotenv
+from logs import get_logger, log_event
+from metrics import supabase_latency
+from upstream import UpstreamClient
 
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# "local" verifies access tokens in-process (signature, exp, aud) against
+# SUPABASE_JWT_SECRET (HS256) or the project's JWKS; "remote" asks Supabase.
+AUTH_VERIFY_MODE = os.getenv("AUTH_VERIFY_MODE", "local").lower()
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+SUPABASE_JWKS_URL = os.getenv(
+    "SUPABASE_JWKS_URL",
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else ""
+)
+AUTH_JWKS_REFRESH = int(os.getenv("AUTH_JWKS_REFRESH", "600"))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024"))
+
+log = get_logger("auth")
+
+# The supabase SDK is a third of the server's import time, and many workers
+# never need it (tokens are verified locally), so the client is built on first use
+_supabase = None
+_supabase_lock = threading.Lock()
+
+
+def get_supabase():
+    """The shared Supabase client. Raises RuntimeError if SUPABASE_URL/SUPABASE_KEY are unset."""
+    global _supabase
+    if _supabase is None:
+        with _supabase_lock:
+            if _supabase is None:
+                if not SUPABASE_URL or not SUPABASE_KEY:
+                    raise RuntimeError("Supabase is not configured: set SUPABASE_URL and SUPABASE_KEY")
+                started = time.perf_counter()
+                from supabase import create_client
+                _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+                log_event(log, "supabase_client_created", seconds=round(time.perf_counter() - started, 4))
+    return _supabase
+
+
+def _jwt():
+    """PyJWT, imported on first use: it loads cryptography, which only token checks need."""
+    import jwt
+    return jwt
+
+
+def _supabase_call(op, fn, *args, **kwargs):
+    """Call a Supabase SDK method, recording its latency and outcome."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        result = fn(*args, **kwargs)
+        outcome = "ok"
+        return result
+    finally:
+        supabase_latency.observe(time.perf_counter() - started, op=op, outcome=outcome)
 
 
 def signup_user(email: str, password: str):
     """Register a new user and trigger a welcome email via Supabase Edge Function."""
     try:
-        response = supabase.auth.sign_up({
+        response = _supabase_call("sign_up", get_supabase().auth.sign_up, {
             "email": email,
             "password": password
         })
@@ -43,7 +100,8 @@ def signup_user(email: str, password: str):
                 # Optionally add other fields like `template_id`, `data`, etc.
             }
 
-            fn_resp = supabase.functions.invoke(
+            fn_resp = _supabase_call(
+                "invoke", get_supabase().functions.invoke,
                 "send-welcome",
                 invoke_options={"body": email_payload}
             )
@@ -64,7 +122,7 @@ def signup_user(email: str, password: str):
 def login_user(email: str, password: str):
     """Login existing user"""
     try:
-        response = supabase.auth.sign_in_with_password({
+        response = _supabase_call("sign_in", get_supabase().auth.sign_in_with_password, {
             "email": email,
             "password": password
         })
@@ -82,10 +140,150 @@ def login_user(email: str, password: str):
         return {"success": False, "error": str(e)}
 
 
+supabase_http = UpstreamClient("supabase", read_timeout=10)
+
+
+class SigningKeys:
+    """JWKS signing keys by kid, refreshed in the background."""
+
+    def __init__(self, url, refresh_every=AUTH_JWKS_REFRESH):
+        self.url = url
+        self.refresh_every = refresh_every
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._last_fetch = 0.0
+        self._thread = None
+
+    def get(self, kid):
+        self._ensure_started()
+        key = self._keys.get(kid)
+        if key is None and time.time() - self._last_fetch > 30:
+            # Unknown kid: the project may have rotated keys since our last fetch
+            self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+    def refresh(self):
+        with self._lock:
+            self._last_fetch = time.time()
+            jwt = _jwt()
+            try:
+                r = supabase_http.get(self.url, headers={"apikey": SUPABASE_KEY or ""})
+                if r.status_code != 200:
+                    log_event(log, "jwks_fetch_failed", level=logging.WARNING, status=r.status_code)
+                    return
+                keys = {}
+                for jwk in r.json().get("keys", []):
+                    try:
+                        keys[jwk.get("kid")] = jwt.PyJWK(jwk)
+                    except jwt.PyJWTError:
+                        continue
+                self._keys = keys
+            except Exception as e:
+                log_event(log, "jwks_fetch_failed", level=logging.WARNING, error=str(e))
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="jwks-refresh", daemon=True)
+            self._thread.start()
+        if not self._keys:
+            self.refresh()
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_every)
+            self.refresh()
+
+
+class VerifiedTokens:
+    """LRU of already-verified tokens, each kept until its own exp."""
+
+    def __init__(self, size=AUTH_TOKEN_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()  # token -> (user, exp)
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            user, exp = entry
+            if exp <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return user
+
+    def put(self, token, user, exp):
+        with self._lock:
+            self._entries[token] = (user, exp)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+
+signing_keys = SigningKeys(SUPABASE_JWKS_URL)
+verified_tokens = VerifiedTokens()
+
+
+def _verify_locally(token: str):
+    """
+    Return (user, exp) for a valid token, or None when we hold no key to check it
+    with (the caller then falls back to Supabase). Raises jwt.PyJWTError if invalid.
+    """
+    jwt = _jwt()
+    header = jwt.get_unverified_header(token)
+    alg = header.get("alg")
+    if alg == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            return None
+        key = SUPABASE_JWT_SECRET
+    elif alg in ("RS256", "ES256", "EdDSA"):
+        jwk = signing_keys.get(header.get("kid")) if SUPABASE_JWKS_URL else None
+        if jwk is None:
+            return None
+        key = jwk.key
+    else:
+        raise jwt.InvalidTokenError(f"unsupported alg {alg}")
+
+    claims = jwt.decode(
+        token,
+        key,
+        algorithms=[alg],
+        audience=SUPABASE_JWT_AUDIENCE,
+        options={"require": ["exp", "sub"]},
+    )
+    user = {"id": claims["sub"], "email": claims.get("email"), "role": claims.get("role"), "claims": claims}
+    return user, claims["exp"]
+
+
 def verify_token(token: str):
     """Verify JWT token and return user"""
+    if AUTH_VERIFY_MODE == "local":
+        jwt = _jwt()
+        user = verified_tokens.get(token)
+        if user is not None:
+            return {"success": True, "user": user}
+        try:
+            verified = _verify_locally(token)
+        except jwt.PyJWTError as e:
+            return {"success": False, "error": str(e)}
+        if verified is not None:
+            user, exp = verified
+            verified_tokens.put(token, user, exp)
+            return {"success": True, "user": user}
+
     try:
-        user = supabase.auth.get_user(token)
+        user = _supabase_call("get_user", get_supabase().auth.get_user, token)
         return {"success": True, "user": user}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -93,8 +291,9 @@ def verify_token(token: str):
 
 def logout_user(token: str):
     """Logout user"""
+    verified_tokens.discard(token)
     try:
-        supabase.auth.sign_out()
+        _supabase_call("sign_out", get_supabase().auth.sign_out)
         return {"success": True}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -106,7 +305,8 @@ def send_email_notification(user_email: str, subject: str, body: str):
     You'll need to create an edge function for this
     """
     try:
-        response = supabase.functions.invoke(
+        response = _supabase_call(
+            "invoke", get_supabase().functions.invoke,
             "send-email",
             invoke_options={
                 "body": {
@@ -134,6 +334,13 @@ def get_user_from_request_header(auth_header: str):
     return None
 
 
+def user_id_of(user):
+    """Supabase user id from check_auth()'s result: a claims dict (local) or an SDK user response (remote)."""
+    if isinstance(user, dict):
+        return user.get("id")
+    return getattr(getattr(user, "user", user), "id", None)
+
+
 def check_auth(handler):
     """
     Helper function to check authentication in request handlers.
@@ -149,8 +356,7 @@ def check_auth(handler):
     user = get_user_from_request_header(auth_header)
     
     if not user:
-        handler._set_headers(401)
-        handler.wfile.write(json.dumps({'error': 'Unauthorized'}).encode())
+        handler._send_json(401, {'error': 'Unauthorized'})
         return None
     
     return user
\ No newline at end of file
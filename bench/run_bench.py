@@ -0,0 +1,344 @@
+"""
+Load benchmark for the Stock In server against local upstream stubs.
+
+Starts bench/stubs.py in-process, launches `server.py` as a subprocess pointed
+at the stubs (and at a throwaway SQLite file), then drives each scenario at
+each concurrency level for a fixed number of requests per level and reports
+p50/p95/p99 latency and throughput. Results are written to bench/results/ as
+JSON and compared with the previous run so regressions stand out.
+
+    python bench/run_bench.py
+    python bench/run_bench.py --scenarios research_cached,recents --concurrency 1,16,64 --requests 500
+    python bench/run_bench.py --groq-latency 1.5 --token-delay 0.03 --compare bench/results/<file>.json
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+RESULTS_DIR = os.path.join(HERE, "results")
+sys.path.insert(0, HERE)
+
+from stubs import start_stubs, add_stub_arguments, config_from_args  # noqa: E402
+
+COMPANIES = ["Apple", "Microsoft", "Tesla", "Amazon", "Google", "Nvidia", "Meta", "Netflix"]
+TABS = ["overview", "financials", "news", "risks"]
+
+
+class Client:
+    """One persistent connection per worker thread; reconnects when the server closes it."""
+
+    def __init__(self, port, timeout=60):
+        self.port = port
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # Stale keep-alive connection: retry once on a fresh one
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if response.will_close:
+                self.close()
+            return response.status, data
+        raise RuntimeError("unreachable")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# --- Scenarios: fn(client, i, ctx) -> status ---
+
+def _auth(ctx):
+    return {"Authorization": f"Bearer {ctx['token']}"}
+
+
+def scenario_static(client, i, ctx):
+    return client.request("GET", "/index.html")[0]
+
+
+def scenario_recents(client, i, ctx):
+    return client.request("GET", "/api/recents?summary=1&limit=50", headers=_auth(ctx))[0]
+
+
+def scenario_research_cached(client, i, ctx):
+    # A small fixed set of questions, so after warm-up every request is a cache hit
+    company = COMPANIES[i % 4]
+    body = {"company": company, "tab": "overview", "question": f"What does {company} do?"}
+    return client.request("POST", "/api/research", body, _auth(ctx))[0]
+
+
+def scenario_research_unique(client, i, ctx):
+    body = {"company": COMPANIES[i % len(COMPANIES)], "tab": TABS[i % len(TABS)],
+            "question": f"bench question {ctx['run_id']} {i}"}
+    return client.request("POST", "/api/research", body, _auth(ctx))[0]
+
+
+def scenario_research_stream(client, i, ctx):
+    body = {"company": COMPANIES[i % len(COMPANIES)], "tab": TABS[i % len(TABS)],
+            "question": f"bench stream {ctx['run_id']} {i}"}
+    return client.request("POST", "/api/research/stream", body, _auth(ctx))[0]
+
+
+def scenario_news(client, i, ctx):
+    return client.request("POST", "/api/news_for_company", {"company_name": COMPANIES[i % len(COMPANIES)]})[0]
+
+
+def scenario_login(client, i, ctx):
+    body = {"email": f"bench{i % 50}@example.com", "password": "bench-password"}
+    return client.request("POST", "/api/auth/login", body)[0]
+
+
+SCENARIOS = {
+    "static": scenario_static,
+    "recents": scenario_recents,
+    "research_cached": scenario_research_cached,
+    "research_unique": scenario_research_unique,
+    "research_stream": scenario_research_stream,
+    "news": scenario_news,
+    "login": scenario_login,
+}
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def run_level(port, scenario, concurrency, total, ctx):
+    """Issue `total` requests with `concurrency` workers; returns the summary dict."""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        client = Client(port)
+        try:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                started = time.perf_counter()
+                try:
+                    status = scenario(client, i, ctx)
+                except Exception:
+                    client.close()
+                    status = "error"
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[str(status)] = statuses.get(str(status), 0) + 1
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    ok = sum(n for s, n in statuses.items() if s.isdigit() and int(s) < 400)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": ok,
+        "statuses": statuses,
+        "seconds": round(wall, 3),
+        "rps": round(total / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(port, proc, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start listening in time")
+
+
+def start_server(port, stub_url, jwt_secret, db_path, extra_args=(), extra_env=None):
+    env = dict(os.environ)
+    env.update({
+        "PORT": str(port),
+        "STOCKIN_DB_PATH": db_path,
+        "GROQ_API_KEY": "bench",
+        "GROQ_API_URL": f"{stub_url}/openai/v1/chat/completions",
+        "NEWSAPI_KEY": "bench",
+        "NEWSAPI_URL": f"{stub_url}/v2/everything",
+        "SUPABASE_URL": stub_url,
+        "SUPABASE_KEY": "bench-anon-key",
+        "SUPABASE_JWT_SECRET": jwt_secret,
+        "RESEARCH_CACHE_SQLITE": "",
+    })
+    env.update(extra_env or {})
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "server.py"), "--port", str(port), *extra_args],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    _wait_for(port, proc)
+    return proc
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def latest_result(exclude=None):
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    files = sorted(f for f in os.listdir(RESULTS_DIR) if f.endswith(".json"))
+    files = [os.path.join(RESULTS_DIR, f) for f in files]
+    files = [f for f in files if f != exclude]
+    return files[-1] if files else None
+
+
+def compare(current, baseline, threshold):
+    """Lines describing levels whose p95 or rps got worse than threshold (fraction) vs baseline."""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+    lines = []
+    for r in current["results"]:
+        old = previous.get((r["scenario"], r["concurrency"]))
+        if not old:
+            continue
+        if old["p95_ms"] and r["p95_ms"] > old["p95_ms"] * (1 + threshold):
+            lines.append(f"  {r['scenario']} c={r['concurrency']}: p95 {old['p95_ms']}ms -> {r['p95_ms']}ms")
+        if old["rps"] and r["rps"] < old["rps"] * (1 - threshold):
+            lines.append(f"  {r['scenario']} c={r['concurrency']}: rps {old['rps']} -> {r['rps']}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="static,recents,research_cached,research_unique,research_stream,news",
+                        help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and level")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each scenario")
+    parser.add_argument("--server-arg", action="append", default=[], help="extra argument for server.py")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the server process")
+    parser.add_argument("--compare", help="results file to compare with (default: latest in bench/results)")
+    parser.add_argument("--threshold", type=float, default=0.15, help="regression threshold as a fraction")
+    parser.add_argument("--no-save", action="store_true", help="do not write a results file")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in names if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+    extra_env = dict(kv.split("=", 1) for kv in args.env)
+
+    stub_config = config_from_args(args)
+    stubs, stub_url = start_stubs(0, stub_config)
+    port = _free_port()
+    tmpdir = tempfile.mkdtemp(prefix="stockin-bench-")
+    server = start_server(port, stub_url, args.jwt_secret, os.path.join(tmpdir, "bench.db"),
+                          args.server_arg, extra_env)
+
+    results = []
+    try:
+        status, data = Client(port).request("POST", "/api/auth/login",
+                                            {"email": "bench@example.com", "password": "bench-password"})
+        if status != 200:
+            raise RuntimeError(f"login against stub failed: {status} {data[:200]!r}")
+        ctx = {"token": json.loads(data)["session"]["access_token"], "run_id": int(time.time())}
+
+        print(f"{'scenario':<18}{'conc':>6}{'reqs':>7}{'ok':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name in names:
+            scenario = SCENARIOS[name]
+            if args.warmup:
+                run_level(port, scenario, min(4, max(levels)), args.warmup, ctx)
+            for level in levels:
+                ctx["run_id"] += 1
+                r = run_level(port, scenario, level, args.requests, ctx)
+                r["scenario"] = name
+                results.append(r)
+                print(f"{name:<18}{level:>6}{r['requests']:>7}{r['ok']:>7}{r['rps']:>9}"
+                      f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        stubs.shutdown()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "python": sys.version.split()[0],
+        "stubs": {k: v for k, v in vars(stub_config).items() if k not in ("lock", "jwt_secret")},
+        "server_args": args.server_arg,
+        "server_env": extra_env,
+        "requests_per_level": args.requests,
+        "results": results,
+    }
+
+    baseline_path = args.compare or latest_result()
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        print(f"\nCompared with {os.path.relpath(baseline_path, ROOT)}:")
+        print("\n".join(regressions) if regressions else f"  no regressions beyond {args.threshold:.0%}")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        path = os.path.join(RESULTS_DIR, f"{stamp}_{report['git']}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved {os.path.relpath(path, ROOT)}")
+
+
+if __name__ == "__main__":
+    main()
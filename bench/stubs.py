@@ -0,0 +1,263 @@
+"""
+Local stand-ins for the upstream APIs Stock In talks to, for benchmarking
+without paid keys. One HTTP server answers all three on different paths:
+
+  POST /openai/v1/chat/completions   Groq chat completions (plain and stream: true)
+  GET  /v2/everything                NewsAPI search
+  *    /auth/v1/...                  Supabase auth (signup, password login, user, logout, JWKS)
+
+Access tokens are HS256 JWTs signed with the given secret, so the server can
+verify them locally (SUPABASE_JWT_SECRET) or remotely through /auth/v1/user.
+
+    python bench/stubs.py --port 9100 --groq-latency 0.8 --token-delay 0.02
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import jwt
+
+DEFAULT_JWT_SECRET = "stockin-bench-secret-which-is-long-enough"
+
+
+class StubConfig:
+    def __init__(self, groq_latency=0.5, token_delay=0.01, tokens=40, news_latency=0.15,
+                 auth_latency=0.05, error_rate=0.0, jwt_secret=DEFAULT_JWT_SECRET):
+        self.groq_latency = groq_latency
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.news_latency = news_latency
+        self.auth_latency = auth_latency
+        self.error_rate = error_rate
+        self.jwt_secret = jwt_secret
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+
+def _user(user_id, email):
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "id": user_id,
+        "aud": "authenticated",
+        "role": "authenticated",
+        "email": email,
+        "app_metadata": {"provider": "email"},
+        "user_metadata": {},
+        "created_at": now,
+        "email_confirmed_at": now,
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw) if raw else {}
+
+    def _fail_randomly(self):
+        if self.config.error_rate and random.random() < self.config.error_rate:
+            self._json(503, {"error": "stub overloaded"}, {"Retry-After": "0"})
+            return True
+        return False
+
+    # --- Groq ---
+
+    def _groq(self):
+        cfg = self.config
+        body = self._body()
+        cfg.count("groq_stream" if body.get("stream") else "groq")
+        if self._fail_randomly():
+            return
+        words = [f"word{i}" for i in range(cfg.tokens)]
+
+        if not body.get("stream"):
+            time.sleep(cfg.groq_latency + cfg.token_delay * cfg.tokens)
+            self._json(200, {
+                "id": "chatcmpl-" + uuid.uuid4().hex,
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 50, "completion_tokens": cfg.tokens, "total_tokens": 50 + cfg.tokens},
+            })
+            return
+
+        time.sleep(cfg.groq_latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(data):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        for i, word in enumerate(words):
+            delta = {"choices": [{"index": 0, "delta": {"content": (" " if i else "") + word}}]}
+            chunk(f"data: {json.dumps(delta)}\n\n".encode("utf-8"))
+            time.sleep(cfg.token_delay)
+        chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    # --- NewsAPI ---
+
+    def _news(self, query):
+        cfg = self.config
+        cfg.count("news")
+        if self._fail_randomly():
+            return
+        time.sleep(cfg.news_latency)
+        q = query.get("q", [""])[0]
+        self._json(200, {
+            "status": "ok",
+            "totalResults": 20,
+            "articles": [
+                {
+                    "source": {"id": None, "name": "Stub Wire"},
+                    "title": f"{q} headline {i}",
+                    "url": f"https://example.com/{q}/{i}",
+                    "publishedAt": "2026-01-01T00:00:00Z",
+                }
+                for i in range(20)
+            ],
+        })
+
+    # --- Supabase auth ---
+
+    def _token_for(self, user_id, email):
+        now = int(time.time())
+        return jwt.encode(
+            {"sub": user_id, "email": email, "aud": "authenticated", "role": "authenticated",
+             "iat": now, "exp": now + 3600},
+            self.config.jwt_secret, algorithm="HS256",
+        )
+
+    def _session(self, email):
+        user_id = str(uuid.uuid5(uuid.NAMESPACE_URL, email))
+        return {
+            "access_token": self._token_for(user_id, email),
+            "refresh_token": uuid.uuid4().hex,
+            "token_type": "bearer",
+            "expires_in": 3600,
+            "expires_at": int(time.time()) + 3600,
+            "user": _user(user_id, email),
+        }
+
+    def _auth(self, method, path):
+        cfg = self.config
+        cfg.count("auth")
+        time.sleep(cfg.auth_latency)
+        if path.endswith("/.well-known/jwks.json"):
+            self._json(200, {"keys": []})
+        elif method == "POST" and path.endswith("/token"):
+            self._json(200, self._session(self._body().get("email", "bench@example.com")))
+        elif method == "POST" and path.endswith("/signup"):
+            self._json(200, self._session(self._body().get("email", "bench@example.com")))
+        elif method == "POST" and path.endswith("/logout"):
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif method == "GET" and path.endswith("/user"):
+            token = (self.headers.get("Authorization") or "").replace("Bearer ", "")
+            try:
+                claims = jwt.decode(token, cfg.jwt_secret, algorithms=["HS256"], audience="authenticated")
+            except jwt.PyJWTError as e:
+                self._json(401, {"code": 401, "msg": str(e)})
+                return
+            self._json(200, _user(claims["sub"], claims.get("email")))
+        elif method == "POST" and "/functions/v1/" in path:
+            self._json(200, {"ok": True})
+        else:
+            self._json(404, {"msg": "not found"})
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/v2/everything":
+            self._news(parse_qs(parsed.query))
+        elif parsed.path.startswith("/auth/v1/"):
+            self._auth("GET", parsed.path)
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/openai/v1/chat/completions":
+            self._groq()
+        elif parsed.path.startswith("/auth/v1/") or parsed.path.startswith("/functions/v1/"):
+            self._auth("POST", parsed.path)
+        else:
+            self._json(404, {"error": "not found"})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping pooled keep-alive connections is routine here
+        pass
+
+
+def start_stubs(port=0, config=None):
+    """Start the stub server on a background thread; returns (server, base_url)."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config or StubConfig()})
+    server = StubServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, name="bench-stubs", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--groq-latency", type=float, default=0.5, help="seconds before the first Groq token")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="seconds between streamed Groq tokens")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per Groq completion")
+    parser.add_argument("--news-latency", type=float, default=0.15)
+    parser.add_argument("--auth-latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls answered 503")
+    parser.add_argument("--jwt-secret", default=DEFAULT_JWT_SECRET)
+
+
+def config_from_args(args):
+    return StubConfig(
+        groq_latency=args.groq_latency, token_delay=args.token_delay, tokens=args.tokens,
+        news_latency=args.news_latency, auth_latency=args.auth_latency,
+        error_rate=args.error_rate, jwt_secret=args.jwt_secret,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9100)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    server, url = start_stubs(args.port, config_from_args(args))
+    print(f"Stubs listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,203 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import groq_client
+from logs import get_logger, log_event
+from models import briefings_due, save_briefing
+from research_cache import research_cache
+
+log = get_logger("briefings")
+
+# UTC hours in which briefings may be generated, e.g. "01:00-06:00,13:00-14:00"
+# (a window may wrap past midnight); "*" allows any time
+BRIEFING_WINDOWS = os.getenv("BRIEFING_WINDOWS", "01:00-06:00")
+# Seconds between scheduler wake-ups; 0 disables the scheduler
+BRIEFING_INTERVAL = float(os.getenv("BRIEFING_INTERVAL", "600"))
+# A briefing older than this many seconds is regenerated (and reported as stale)
+BRIEFING_MAX_AGE = int(os.getenv("BRIEFING_MAX_AGE", "86400"))
+BRIEFING_CONCURRENCY = int(os.getenv("BRIEFING_CONCURRENCY", "2"))
+# Groq calls started per minute, across all concurrent briefings
+BRIEFING_RATE_PER_MINUTE = float(os.getenv("BRIEFING_RATE_PER_MINUTE", "10"))
+BRIEFING_MAX_PER_PASS = int(os.getenv("BRIEFING_MAX_PER_PASS", "200"))
+BRIEFING_TAB = "News"
+BRIEFING_QUESTION = os.getenv(
+    "BRIEFING_QUESTION",
+    "What's new with this company? Summarise the latest news, results and outlook in a short briefing.",
+)
+# Consecutive failed calls after which a pass gives up (Groq is down or rejecting us)
+BRIEFING_MAX_FAILURES = 3
+
+
+def parse_windows(spec):
+    """[(start_minute, end_minute), ...] from "HH:MM-HH:MM,..."; None means any time."""
+    spec = (spec or '').strip()
+    if spec == '*':
+        return None
+    windows = []
+    for part in spec.split(','):
+        if not part.strip():
+            continue
+        start, _, end = part.partition('-')
+        try:
+            windows.append(tuple(int(h) * 60 + int(m) for h, m in
+                                 (t.strip().split(':') for t in (start, end))))
+        except ValueError:
+            log_event(log, "briefing_window_invalid", level=logging.WARNING, window=part)
+    return windows
+
+
+def in_window(windows, now=None):
+    if windows is None:
+        return True
+    now = now or datetime.utcnow()
+    minute = now.hour * 60 + now.minute
+    for start, end in windows:
+        if start <= end:
+            if start <= minute < end:
+                return True
+        elif minute >= start or minute < end:
+            return True
+    return False
+
+
+class RateBudget:
+    """Token bucket: at most `per_minute` acquisitions per minute, with no burst beyond one."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, stop):
+        """Wait for the next slot; False if stop was set while waiting."""
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        return not stop.wait(at - now) if at > now else not stop.is_set()
+
+
+class BriefingScheduler:
+    """
+    Background thread that, inside BRIEFING_WINDOWS, asks Groq for a briefing
+    on every favourited company whose briefing is missing or older than
+    max_age, at most `concurrency` at a time and `rate_per_minute` in all.
+    """
+
+    def __init__(self, windows=BRIEFING_WINDOWS, interval=BRIEFING_INTERVAL, max_age=BRIEFING_MAX_AGE,
+                 concurrency=BRIEFING_CONCURRENCY, rate_per_minute=BRIEFING_RATE_PER_MINUTE):
+        self.windows = parse_windows(windows)
+        self.interval = interval
+        self.max_age = max_age
+        self.concurrency = concurrency
+        self.budget = RateBudget(rate_per_minute)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'passes': 0, 'generated': 0, 'failed': 0, 'aborted_passes': 0,
+                       'last_run': None, 'last_result': None}
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="briefing-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def is_stale(self, generated_at):
+        if not generated_at:
+            return True
+        return datetime.fromisoformat(generated_at) < datetime.utcnow() - timedelta(seconds=self.max_age)
+
+    def run_once(self, ignore_window=False):
+        """One pass over due briefings. Returns a summary dict."""
+        started = time.perf_counter()
+        cutoff = (datetime.utcnow() - timedelta(seconds=self.max_age)).isoformat()
+        due = briefings_due(cutoff, BRIEFING_MAX_PER_PASS)
+        result = {'due': len(due), 'generated': 0, 'failed': 0, 'aborted': False}
+        failures = 0
+        halt = threading.Event()
+
+        def brief(company_id, name):
+            nonlocal failures
+            if halt.is_set() or (not ignore_window and not in_window(self.windows)):
+                return
+            if not self.budget.acquire(self._stop):
+                return
+            answer, ok = groq_client.ask(groq_client.build_prompt(name, BRIEFING_TAB, BRIEFING_QUESTION))
+            with self._lock:
+                if not ok:
+                    result['failed'] += 1
+                    failures += 1
+                    if failures >= BRIEFING_MAX_FAILURES:
+                        result['aborted'] = True
+                        halt.set()
+                    return
+                failures = 0
+                result['generated'] += 1
+            save_briefing(company_id, answer)
+            # The same question asked from the research page is then answered instantly
+            research_cache.set(name, BRIEFING_TAB, BRIEFING_QUESTION, answer)
+
+        if due:
+            with ThreadPoolExecutor(max_workers=max(1, self.concurrency),
+                                    thread_name_prefix="briefing") as pool:
+                for f in [pool.submit(brief, company_id, name) for company_id, name in due]:
+                    try:
+                        f.result()
+                    except Exception as e:
+                        with self._lock:
+                            result['failed'] += 1
+                        log_event(log, "briefing_error", level=logging.WARNING, error=str(e))
+
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        with self._lock:
+            self._stats['passes'] += 1
+            self._stats['generated'] += result['generated']
+            self._stats['failed'] += result['failed']
+            self._stats['aborted_passes'] += result['aborted']
+            self._stats['last_run'] = datetime.utcnow().isoformat()
+            self._stats['last_result'] = result
+        if due:
+            log_event(log, "briefings_generated", **result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['running'] = self.running
+        stats['in_window'] = in_window(self.windows)
+        return stats
+
+    def _run(self):
+        while not self._stop.is_set():
+            if in_window(self.windows):
+                try:
+                    self.run_once()
+                except Exception as e:
+                    log_event(log, "briefing_pass_error", level=logging.ERROR, error=str(e))
+            if self._stop.wait(self.interval):
+                return
+
+
+briefing_scheduler = BriefingScheduler()
+
+
+if __name__ == '__main__':
+    # One pass now, whatever the time, e.g. to fill briefings for new favourites
+    print(briefing_scheduler.run_once(ignore_window=True))
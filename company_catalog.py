@@ -0,0 +1,245 @@
+import csv
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime
+
+from db import transaction, query, with_retry
+from logs import get_logger, log_event
+from research_cache import normalize
+
+log = get_logger("company_catalog")
+
+# Seconds between checks for catalog rows changed by another process (an import, another worker)
+COMPANY_INDEX_REFRESH = float(os.getenv("COMPANY_INDEX_REFRESH", "30"))
+COMPANY_SEARCH_LIMIT = int(os.getenv("COMPANY_SEARCH_LIMIT", "10"))
+# Rows per write transaction during a CSV import
+COMPANY_IMPORT_BATCH = 2000
+# More changed rows than this in one refresh re-sorts the whole index instead of inserting one by one
+_REBUILD_AFTER = 1000
+
+# Accepted CSV headers, compared lower-cased
+NAME_COLUMNS = ('name', 'company', 'company_name', 'company name', 'security name')
+TICKER_COLUMNS = ('ticker', 'symbol', 'act symbol')
+
+
+def _column(fieldnames, choices):
+    for field in fieldnames or ():
+        if field.strip().lower() in choices:
+            return field
+    return None
+
+
+def read_csv(path):
+    """Yield (name, ticker) from a catalog CSV with a name column and an optional ticker column."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        name_col = _column(reader.fieldnames, NAME_COLUMNS)
+        ticker_col = _column(reader.fieldnames, TICKER_COLUMNS)
+        if name_col is None:
+            raise ValueError(f"{path}: no company name column (expected one of {', '.join(NAME_COLUMNS)})")
+        for row in reader:
+            name = (row.get(name_col) or '').strip()
+            if not name:
+                continue
+            ticker = (row.get(ticker_col) or '').strip().upper() if ticker_col else ''
+            yield name, ticker or None
+
+
+def import_rows(rows, batch=COMPANY_IMPORT_BATCH):
+    """
+    Upsert (name, ticker) pairs into company by name, in batches. Existing
+    companies keep their favourite flag; a non-empty ticker replaces theirs.
+    Returns rows read.
+    """
+    written = 0
+    pending = []
+
+    def flush():
+        now = datetime.utcnow().isoformat()
+
+        def write():
+            with transaction() as cur:
+                before = cur.execute('SELECT COALESCE(MAX(id), 0) FROM company').fetchone()[0]
+                cur.executemany('''
+                    INSERT INTO company (company_name, ticker, isFavourite, created_at, updated_at)
+                    VALUES (?, ?, 0, ?, ?)
+                    ON CONFLICT(company_name) DO UPDATE SET
+                        ticker = excluded.ticker,
+                        updated_at = excluded.updated_at
+                    WHERE ticker IS NOT excluded.ticker AND excluded.ticker IS NOT NULL
+                ''', [(name, ticker, now, now) for name, ticker in pending])
+                # Favourites are addressed by company_id; give this batch's new rows one.
+                # They are the ids above `before`, a rowid range rather than a table scan
+                cur.execute('UPDATE company SET company_id = id WHERE id > ? AND company_id IS NULL',
+                            (before,))
+        with_retry(write)
+
+    for row in rows:
+        pending.append(row)
+        if len(pending) >= batch:
+            flush()
+            written += len(pending)
+            pending = []
+    if pending:
+        flush()
+        written += len(pending)
+    return written
+
+
+def import_csv(path):
+    started = time.perf_counter()
+    written = import_rows(read_csv(path))
+    company_index.refresh()
+    log_event(log, "company_catalog_imported", path=path, rows=written,
+              seconds=round(time.perf_counter() - started, 3))
+    return written
+
+
+class CompanyIndex:
+    """
+    In-memory prefix index over company names and tickers: sorted lists of
+    (key, company id) searched with bisect. Names and tickers are matched
+    first, then later words of a name, so "micro" still finds "Advanced Micro
+    Devices". Rows changed since the last refresh (by updated_at, id) are
+    merged in place; large changes are re-sorted aside and swapped in.
+    """
+
+    def __init__(self, refresh_every=COMPANY_INDEX_REFRESH):
+        self.refresh_every = refresh_every
+        self._starts = []       # sorted (whole name or ticker, id)
+        self._words = []        # sorted (name from its 2nd, 3rd, ... word on, id)
+        self._companies = {}    # id -> (name, ticker)
+        self._seen = ('', 0)    # (updated_at, id) of the last row merged
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stats = {'searches': 0, 'refreshes': 0, 'rebuilds': 0}
+
+    @staticmethod
+    def _keys_for(rec_id, name, ticker):
+        words = normalize(name).split()
+        starts = {(' '.join(words), rec_id)} if words else set()
+        # Normalized like the query, so "BRK.B" and "brk b" both find "brk b"
+        ticker = normalize(ticker)
+        if ticker:
+            starts.add((ticker, rec_id))
+        return starts, {(' '.join(words[i:]), rec_id) for i in range(1, len(words))}
+
+    def refresh(self):
+        """Merge catalog rows added or changed since the last refresh. Returns rows that changed."""
+        # One refresh at a time; a search arriving meanwhile uses the index as it is
+        if not self._refresh_lock.acquire(blocking=False):
+            return 0
+        try:
+            seen, seen_id = self._seen
+            # Strictly after the (updated_at, id) cursor: an import stamps a whole batch
+            # with one updated_at, so ">= updated_at" alone would re-read it every time
+            rows = query('''
+                SELECT id, company_name, ticker, updated_at FROM company
+                WHERE updated_at >= ? AND (updated_at > ? OR id > ?)
+                ORDER BY updated_at, id
+            ''', (seen, seen, seen_id))
+            self._checked = time.monotonic()
+            if not rows:
+                return 0
+            self._seen = (rows[-1][3] or seen, rows[-1][0])
+            changed = [(rec_id, name, ticker) for rec_id, name, ticker, _ in rows
+                       if self._companies.get(rec_id) != (name, ticker)]
+            if len(changed) > _REBUILD_AFTER:
+                self._rebuild(changed)
+            elif changed:
+                self._merge(changed)
+            return len(changed)
+        finally:
+            self._refresh_lock.release()
+
+    def _merge(self, changed):
+        with self._lock:
+            self._stats['refreshes'] += 1
+            for rec_id, name, ticker in changed:
+                old = self._companies.get(rec_id)
+                self._companies[rec_id] = (name, ticker)
+                if old is not None:
+                    for keys, index in zip(self._keys_for(rec_id, *old), (self._starts, self._words)):
+                        for key in keys:
+                            i = bisect_left(index, key)
+                            if i < len(index) and index[i] == key:
+                                del index[i]
+                for keys, index in zip(self._keys_for(rec_id, name, ticker), (self._starts, self._words)):
+                    for key in keys:
+                        insort(index, key)
+
+    def _rebuild(self, changed):
+        # Sorted outside the lock and swapped in, so searches keep running meanwhile
+        companies = dict(self._companies)
+        companies.update((rec_id, (name, ticker)) for rec_id, name, ticker in changed)
+        starts, words = [], []
+        for rec_id, (name, ticker) in companies.items():
+            s, w = self._keys_for(rec_id, name, ticker)
+            starts.extend(s)
+            words.extend(w)
+        starts.sort()
+        words.sort()
+        with self._lock:
+            self._stats['refreshes'] += 1
+            self._stats['rebuilds'] += 1
+            self._companies, self._starts, self._words = companies, starts, words
+
+    def search(self, text, limit=COMPANY_SEARCH_LIMIT):
+        """Up to limit (id, name, ticker) whose name, ticker or a later word of the name starts with text."""
+        if time.monotonic() - self._checked > self.refresh_every:
+            try:
+                self.refresh()
+            except Exception as e:
+                # Serve the index we have rather than fail a keystroke
+                self._checked = time.monotonic()
+                log_event(log, "company_index_refresh_failed", level=logging.WARNING, error=str(e))
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        with self._lock:
+            self._stats['searches'] += 1
+            found = {}
+            # An exact ticker ("F", "T") goes first, ahead of every name starting with it
+            for rec_id in self._matches(self._starts, prefix, exact=True):
+                if normalize(self._companies[rec_id][1]) == prefix:
+                    found[rec_id] = None
+            for index in (self._starts, self._words):
+                for rec_id in self._matches(index, prefix):
+                    if len(found) >= limit:
+                        break
+                    found[rec_id] = None
+            return [(rec_id, *self._companies[rec_id]) for rec_id in list(found)[:limit]]
+
+    @staticmethod
+    def _matches(index, prefix, exact=False):
+        i = bisect_left(index, (prefix,))
+        while i < len(index):
+            key, rec_id = index[i]
+            if not key.startswith(prefix) or (exact and key != prefix):
+                return
+            yield rec_id
+            i += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['companies'] = len(self._companies)
+            stats['keys'] = len(self._starts) + len(self._words)
+        return stats
+
+
+company_index = CompanyIndex()
+
+
+if __name__ == '__main__':
+    # python company_catalog.py companies.csv
+    if len(sys.argv) != 2:
+        sys.exit("usage: python company_catalog.py <catalog.csv>")
+    from models import init_db
+    init_db()
+    print(f"Imported {import_csv(sys.argv[1])} companies")
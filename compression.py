@@ -0,0 +1,75 @@
+import logging
+import os
+import threading
+import zlib
+
+from logs import get_logger, log_event
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for RECENTS_COMPRESSION=zstd
+    zstandard = None
+
+log = get_logger("compression")
+
+# How stored answers in recents.response are compressed: zlib, zstd or none.
+# Rows are self-describing, so the setting can change at any time; rows written
+# under an older setting (or plain TEXT from before compression) still read.
+RECENTS_COMPRESSION = os.getenv("RECENTS_COMPRESSION", "zlib").lower()
+RECENTS_COMPRESSION_LEVEL = int(os.getenv("RECENTS_COMPRESSION_LEVEL", "6"))
+# Shorter answers are stored as plain text; the header would eat the savings
+RECENTS_COMPRESS_MIN_BYTES = int(os.getenv("RECENTS_COMPRESS_MIN_BYTES", "128"))
+
+# First byte of a compressed BLOB names its codec
+_ZLIB = b'z'
+_ZSTD = b's'
+
+if RECENTS_COMPRESSION == 'zstd' and zstandard is None:
+    log_event(log, "zstd_unavailable", level=logging.WARNING, fallback="zlib")
+    RECENTS_COMPRESSION = 'zlib'
+
+# zstandard (de)compressor objects must not be shared between threads
+_zstd = threading.local()
+
+
+def _zstd_compressor():
+    c = getattr(_zstd, 'c', None)
+    if c is None:
+        c = _zstd.c = zstandard.ZstdCompressor(level=RECENTS_COMPRESSION_LEVEL)
+    return c
+
+
+def _zstd_decompressor():
+    if zstandard is None:
+        raise RuntimeError("recents row is zstd-compressed but the zstandard package is not installed")
+    d = getattr(_zstd, 'd', None)
+    if d is None:
+        d = _zstd.d = zstandard.ZstdDecompressor()
+    return d
+
+
+def compress_text(text, codec=None):
+    """Value to store for text: a codec-tagged BLOB, or text itself when not worth it."""
+    codec = codec or RECENTS_COMPRESSION
+    if text is None or codec == 'none':
+        return text
+    raw = text.encode('utf-8')
+    if len(raw) < RECENTS_COMPRESS_MIN_BYTES:
+        return text
+    if codec == 'zstd':
+        packed = _ZSTD + _zstd_compressor().compress(raw)
+    else:
+        packed = _ZLIB + zlib.compress(raw, RECENTS_COMPRESSION_LEVEL)
+    return packed if len(packed) < len(raw) else text
+
+
+def decompress_text(value):
+    """Inverse of compress_text; TEXT values pass through unchanged."""
+    if not isinstance(value, bytes):
+        return value
+    tag, body = value[:1], value[1:]
+    if tag == _ZLIB:
+        return zlib.decompress(body).decode('utf-8')
+    if tag == _ZSTD:
+        return _zstd_decompressor().decompress(body).decode('utf-8')
+    return value.decode('utf-8', errors='replace')
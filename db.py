@@ -0,0 +1,130 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from compression import decompress_text
+from metrics import sqlite_latency
+
+DB_PATH = os.getenv("STOCKIN_DB_PATH", os.path.join(os.path.dirname(__file__), 'stock_in.db'))
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
+SQLITE_LOCK_RETRIES = int(os.getenv("SQLITE_LOCK_RETRIES", "5"))
+
+_local = threading.local()
+# Connections inherited over fork(); kept referenced so they are never closed
+# (and possibly checkpointed) from the child, and never used either
+_inherited = []
+
+
+def _connect():
+    # isolation_level=None: reads run in autocommit, writes use transaction() below
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        cached_statements=SQLITE_STATEMENT_CACHE,
+    )
+    # Only takes effect on a new, empty database; `python recents_compactor.py --convert` converts older ones
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    # recents.response may hold a compressed BLOB; SQL reads it through this
+    conn.create_function('recent_text', 1, decompress_text, deterministic=True)
+    return conn
+
+
+def get_conn():
+    """Return this thread's connection to stock_in.db, opening it on first use."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+    return conn
+
+
+def close_conn():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+def _forget_inherited_conn():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _inherited.append(conn)
+        _local.conn = None
+
+
+# SQLite connections must not cross a fork: a pre-forked worker opens its own
+os.register_at_fork(after_in_child=_forget_inherited_conn)
+
+
+def _is_lock_error(err):
+    msg = str(err).lower()
+    return 'locked' in msg or 'busy' in msg
+
+
+def with_retry(fn):
+    """Retry fn() when SQLite reports the database as locked/busy past busy_timeout."""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except sqlite3.OperationalError as e:
+            if not _is_lock_error(e) or attempt >= SQLITE_LOCK_RETRIES:
+                raise
+            attempt += 1
+            time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+
+
+@contextmanager
+def transaction():
+    """BEGIN IMMEDIATE ... COMMIT on this thread's connection; rolls back on error."""
+    conn = get_conn()
+    started = time.perf_counter()
+    with_retry(lambda: conn.execute('BEGIN IMMEDIATE'))
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+    finally:
+        sqlite_latency.observe(time.perf_counter() - started, op='write')
+
+
+def query(sql, params=()):
+    started = time.perf_counter()
+    try:
+        return with_retry(lambda: get_conn().execute(sql, params).fetchall())
+    finally:
+        sqlite_latency.observe(time.perf_counter() - started, op='read')
+
+
+def query_one(sql, params=()):
+    started = time.perf_counter()
+    try:
+        return with_retry(lambda: get_conn().execute(sql, params).fetchone())
+    finally:
+        sqlite_latency.observe(time.perf_counter() - started, op='read')
+
+
+def execute(sql, params=()):
+    """Run one write statement in its own transaction; returns the cursor's lastrowid."""
+    def run():
+        with transaction() as cur:
+            cur.execute(sql, params)
+            return cur.lastrowid
+    return with_retry(run)
@@ -0,0 +1,137 @@
+import os
+import json
+import logging
+import time
+from dotenv import load_dotenv
+from logs import get_logger, log_event, LOG_SAMPLE_RATE
+from upstream import groq_http, RETRY_STATUSES
+from upstream_guard import groq_guard, UpstreamUnavailable
+
+load_dotenv()
+
+GROQ_KEY = os.getenv("GROQ_API_KEY")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")  # default Groq model
+GROQ_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+
+log = get_logger("groq")
+
+
+def build_prompt(company, tab, question):
+    return f"You are a financial assistant. Provide concise, factual information about {company} focusing on {tab}. Question: {question}"
+
+
+def build_payload(prompt, stream=False):
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are a financial assistant for Stock In."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 800,
+        "temperature": 0.3
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def _headers():
+    return {
+        "Authorization": f"Bearer {GROQ_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+def _outcome(status):
+    # What a response says about Groq's load, for the adaptive limit and breaker
+    if status == 200:
+        return 'success'
+    if status in RETRY_STATUSES:
+        return 'failure'
+    return None
+
+
+def ask(prompt):
+    """Ask Groq for a completion. Returns (answer, ok); on failure answer is the error text."""
+    if not GROQ_KEY:
+        return "[No GROQ_API_KEY set in .env]", False
+
+    started = time.perf_counter()
+    try:
+        with groq_guard.slot() as slot:
+            r = groq_http.post(
+                GROQ_URL,
+                headers=_headers(),
+                json=build_payload(prompt)
+            )
+            slot.outcome = _outcome(r.status_code)
+        elapsed = round(time.perf_counter() - started, 4)
+
+        if r.status_code == 200:
+            j = r.json()
+            answer = (
+                j.get("choices", [{}])[0]
+                .get("message", {})
+                .get("content", "[No content returned]")
+            )
+            log_event(log, "groq_response", sample=LOG_SAMPLE_RATE, status=r.status_code,
+                      seconds=elapsed, chars=len(answer), usage=j.get("usage"))
+            return answer, True
+        log_event(log, "groq_error", level=logging.WARNING, status=r.status_code,
+                  seconds=elapsed, body=r.text[:200])
+        return f"[Groq API error {r.status_code}] {r.text}", False
+
+    except UpstreamUnavailable as e:
+        log_event(log, "groq_rejected", sample=LOG_SAMPLE_RATE, reason=e.reason)
+        return str(e), False
+    except Exception as e:
+        log_event(log, "groq_error", level=logging.WARNING, error=str(e))
+        return f"[Groq API call failed: {str(e)}]", False
+
+
+def stream(prompt):
+    """
+    Stream a Groq completion, yielding text deltas as they arrive.
+    Raises RuntimeError (with the same bracketed text ask() would return) on
+    failure; UpstreamUnavailable, a RuntimeError, when the guard turns it away.
+    """
+    if not GROQ_KEY:
+        raise RuntimeError("[No GROQ_API_KEY set in .env]")
+
+    with groq_guard.slot() as slot:
+        started = time.monotonic()
+        try:
+            r = groq_http.post(
+                GROQ_URL,
+                headers=_headers(),
+                json=build_payload(prompt, stream=True),
+                stream=True
+            )
+        except Exception as e:
+            raise RuntimeError(f"[Groq API call failed: {str(e)}]")
+        # Judge load by time to first byte; a long answer streaming steadily is fine
+        slot.elapsed = time.monotonic() - started
+        slot.outcome = _outcome(r.status_code)
+        yield from _stream_body(r, slot)
+
+
+def _stream_body(r, slot):
+    with r:
+        if r.status_code != 200:
+            log_event(log, "groq_error", level=logging.WARNING, status=r.status_code,
+                      stream=True, body=r.text[:200])
+            raise RuntimeError(f"[Groq API error {r.status_code}] {r.text}")
+        try:
+            for line in r.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                delta = chunk.get("choices", [{}])[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+        except Exception as e:
+            slot.outcome = 'failure'
+            raise RuntimeError(f"[Groq API call failed: {str(e)}]")
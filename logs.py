@@ -0,0 +1,53 @@
+import json
+import logging
+import os
+import random
+import sys
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Fraction of routine per-request events (access log, Groq responses) that get logged.
+# Warnings and errors are always logged.
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, event plus any structured fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_root = logging.getLogger('stockin')
+if not _root.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(JsonFormatter())
+    _root.addHandler(_handler)
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False
+
+
+def get_logger(name):
+    return logging.getLogger(f'stockin.{name}')
+
+
+def log_event(logger, event, level=logging.INFO, sample=None, **fields):
+    """
+    Log event with structured fields. With sample set, only that fraction of
+    calls is logged; sampled entries carry sample_rate so counts can be scaled.
+    """
+    if sample is not None:
+        if sample <= 0 or random.random() >= sample:
+            return
+        fields['sample_rate'] = sample
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'fields': fields})
+
@@ -1,12 +1,33 @@
-import sqlite3
+import html
 import os
+import re
+import sqlite3
 from datetime import datetime
+from compression import compress_text
+from db import DB_PATH, get_conn, transaction, query, query_one, execute
 
-DB_PATH = os.path.join(os.path.dirname(__file__), 'stock_in.db')
+# Characters of each answer returned by get_recents(summary=True)
+RECENT_PREVIEW_CHARS = 240
+# Rows fetched from SQLite per step of iter_recents()
+RECENTS_EXPORT_BATCH = 200
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+# Put around matched terms by snippet(): control characters that prompts and answers do not contain
+_MARK_OPEN, _MARK_CLOSE = '\x02', '\x03'
+
+# Supabase user id that owns recents and favourites saved before they were per-user
+LEGACY_USER_ID = os.getenv("STOCKIN_LEGACY_USER_ID", "")
+
+# Called with [(id, company, tab, prompt, created_at, user_id), ...] after recents are saved
+_save_listeners = []
+
+def on_recents_saved(fn):
+    _save_listeners.append(fn)
+
+def _notify_saved(saved):
+    for fn in _save_listeners:
+        fn(saved)
+
+def _create_tables(cur):
     cur.execute('''
     CREATE TABLE IF NOT EXISTS recents (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -17,7 +38,7 @@ def init_db():
         created_at TEXT
     )
     ''')
-    
+
     cur.execute('''
     CREATE TABLE IF NOT EXISTS company (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -27,7 +48,60 @@ def init_db():
         created_at TEXT
     )
     ''')
-    
+
+    # Keyset pagination / filters on recents always walk an index in id order
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_recents_company_id ON recents (company, id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_recents_tab_id ON recents (tab, id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_recents_company_tab_id ON recents (company, tab, id)')
+
+def _create_recents_fts(cur):
+    # recents.response may be a compressed BLOB (see compression.py); this
+    # view, and the FTS index built from it, see the decompressed text
+    cur.execute('''
+    CREATE VIEW IF NOT EXISTS recents_text AS
+        SELECT id, prompt, recent_text(response) AS response FROM recents
+    ''')
+
+    # Full-text index over prompts and answers, kept in sync by triggers
+    cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'recents_fts'")
+    row = cur.fetchone()
+    if row is not None and "content='recents_text'" not in row[0]:
+        # Index from before compression read recents directly; rebuild it over the view
+        for name in ('recents_fts_ai', 'recents_fts_ad', 'recents_fts_au'):
+            cur.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cur.execute('DROP TABLE recents_fts')
+        row = None
+    fts_exists = row is not None
+    cur.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS recents_fts USING fts5(
+        prompt, response,
+        content='recents_text', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    ''')
+    cur.execute('''
+    CREATE TRIGGER IF NOT EXISTS recents_fts_ai AFTER INSERT ON recents BEGIN
+        INSERT INTO recents_fts (rowid, prompt, response) VALUES (new.id, new.prompt, recent_text(new.response));
+    END
+    ''')
+    cur.execute('''
+    CREATE TRIGGER IF NOT EXISTS recents_fts_ad AFTER DELETE ON recents BEGIN
+        INSERT INTO recents_fts (recents_fts, rowid, prompt, response) VALUES ('delete', old.id, old.prompt, recent_text(old.response));
+    END
+    ''')
+    cur.execute('''
+    CREATE TRIGGER IF NOT EXISTS recents_fts_au AFTER UPDATE ON recents BEGIN
+        INSERT INTO recents_fts (recents_fts, rowid, prompt, response) VALUES ('delete', old.id, old.prompt, recent_text(old.response));
+        INSERT INTO recents_fts (rowid, prompt, response) VALUES (new.id, new.prompt, recent_text(new.response));
+    END
+    ''')
+    if not fts_exists:
+        # Rank prompt matches twice as high as answer matches
+        cur.execute("INSERT INTO recents_fts (recents_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0)')")
+        # One-off backfill of rows saved before the index existed
+        cur.execute("INSERT INTO recents_fts (recents_fts) VALUES ('rebuild')")
+
+def _seed_companies(cur):
     # ✅ Seed initial companies if none exist
     cur.execute('SELECT COUNT(*) FROM company')
     count = cur.fetchone()[0]
@@ -55,76 +129,424 @@ def init_db():
         ''', [(cid, cname, now) for cid, cname in companies])
         print(f"✅ Seeded {len(companies)} companies")
 
-    conn.commit()
-    conn.close()
+def _add_company_catalog_columns(cur):
+    # Tickers for the imported catalog; updated_at lets each process's
+    # autocomplete index pick up catalog changes incrementally
+    cur.execute('ALTER TABLE company ADD COLUMN ticker TEXT')
+    cur.execute('ALTER TABLE company ADD COLUMN updated_at TEXT')
+    cur.execute('UPDATE company SET updated_at = COALESCE(created_at, ?)', (datetime.utcnow().isoformat(),))
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_company_ticker ON company (ticker)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_company_updated_at ON company (updated_at)')
+
+def _scope_to_users(cur):
+    # History and favourites belong to the Supabase user that created them.
+    # Rows from before this keep user_id NULL until assign_legacy_rows() hands
+    # them to someone; STOCKIN_LEGACY_USER_ID does that during the migration.
+    cur.execute('ALTER TABLE recents ADD COLUMN user_id TEXT')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_recents_user_id ON recents (user_id, id DESC)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_recents_user_company_tab_id ON recents (user_id, company, tab, id DESC)')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS user_favourites (
+        user_id TEXT NOT NULL,
+        company_id INTEGER NOT NULL REFERENCES company (id),
+        created_at TEXT,
+        PRIMARY KEY (user_id, company_id)
+    ) WITHOUT ROWID
+    ''')
+    # Newest-first listing per user without a sort
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_user_favourites_user_created ON user_favourites (user_id, created_at DESC)')
+    if LEGACY_USER_ID:
+        _assign_legacy_rows(cur, LEGACY_USER_ID)
+
+def _create_company_briefings(cur):
+    # Precomputed "what's new" answer per favourited company, shared by every
+    # user who favourites it; the text is stored like recents.response
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS company_briefings (
+        company_id INTEGER PRIMARY KEY REFERENCES company (id),
+        briefing TEXT,
+        generated_at TEXT
+    )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_user_favourites_company ON user_favourites (company_id)')
+
+def _index_recents_per_user(cur):
+    # Every recents read is scoped to one user now, so the global company/tab
+    # indexes from step 1 only cost writes; filters walk these instead
+    for name in ('idx_recents_company_id', 'idx_recents_tab_id', 'idx_recents_company_tab_id'):
+        cur.execute(f'DROP INDEX IF EXISTS {name}')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_recents_user_company_id ON recents (user_id, company, id DESC)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_recents_user_tab_id ON recents (user_id, tab, id DESC)')
 
-def save_recent(company, tab, prompt, response):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+def _index_recents_fts_owner(cur):
+    # Searches filter on owner inside the FTS query, so BM25 only ranks the
+    # searching user's matches rather than every user's. owner is last so the
+    # prompt/response column numbers used by snippet() stay the same.
+    for name in ('recents_fts_ai', 'recents_fts_ad', 'recents_fts_au'):
+        cur.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cur.execute('DROP TABLE IF EXISTS recents_fts')
+    cur.execute('DROP VIEW IF EXISTS recents_text')
+    cur.execute('''
+    CREATE VIEW recents_text AS
+        SELECT id, prompt, recent_text(response) AS response, user_id AS owner FROM recents
+    ''')
+    cur.execute('''
+    CREATE VIRTUAL TABLE recents_fts USING fts5(
+        prompt, response, owner,
+        content='recents_text', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    ''')
     cur.execute('''
-        INSERT INTO recents (company, tab, prompt, response, created_at)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (company, tab, prompt, response, datetime.utcnow().isoformat()))
-    conn.commit()
-    conn.close()
-
-def get_recents(limit=50):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    CREATE TRIGGER recents_fts_ai AFTER INSERT ON recents BEGIN
+        INSERT INTO recents_fts (rowid, prompt, response, owner)
+        VALUES (new.id, new.prompt, recent_text(new.response), new.user_id);
+    END
+    ''')
     cur.execute('''
-        SELECT id, company, tab, prompt, response, created_at
+    CREATE TRIGGER recents_fts_ad AFTER DELETE ON recents BEGIN
+        INSERT INTO recents_fts (recents_fts, rowid, prompt, response, owner)
+        VALUES ('delete', old.id, old.prompt, recent_text(old.response), old.user_id);
+    END
+    ''')
+    cur.execute('''
+    CREATE TRIGGER recents_fts_au AFTER UPDATE ON recents BEGIN
+        INSERT INTO recents_fts (recents_fts, rowid, prompt, response, owner)
+        VALUES ('delete', old.id, old.prompt, recent_text(old.response), old.user_id);
+        INSERT INTO recents_fts (rowid, prompt, response, owner)
+        VALUES (new.id, new.prompt, recent_text(new.response), new.user_id);
+    END
+    ''')
+    # owner only filters; it adds nothing to the rank
+    cur.execute("INSERT INTO recents_fts (recents_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0, 0.0)')")
+    cur.execute("INSERT INTO recents_fts (recents_fts) VALUES ('rebuild')")
+
+# Schema steps in the order they were introduced. Each database records the
+# versions it has applied in schema_migrations, so a current one costs a
+# single SELECT at start-up. Append new steps; never renumber released ones.
+# Steps 1-3 are idempotent, since databases from before this table exist.
+MIGRATIONS = [
+    (1, 'recents and company tables', _create_tables),
+    (2, 'recents full-text index', _create_recents_fts),
+    (3, 'seed companies', _seed_companies),
+    (4, 'company tickers', _add_company_catalog_columns),
+    (5, 'per-user recents and favourites', _scope_to_users),
+    (6, 'company briefings', _create_company_briefings),
+    (7, 'per-user recents indexes', _index_recents_per_user),
+    (8, 'recents full-text index by owner', _index_recents_fts_owner),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version():
+    """Highest migration applied to the database, 0 if none are recorded."""
+    try:
+        return query_one('SELECT MAX(version) FROM schema_migrations')[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+def init_db():
+    """Apply pending MIGRATIONS. Returns the versions applied, [] when already current."""
+    if schema_version() >= SCHEMA_VERSION:
+        return []
+    applied = []
+    with transaction() as cur:
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TEXT
+        )
+        ''')
+        # Re-read under the write lock: another process may have migrated meanwhile
+        cur.execute('SELECT COALESCE(MAX(version), 0) FROM schema_migrations')
+        current = cur.fetchone()[0]
+        for version, name, step in MIGRATIONS:
+            if version <= current:
+                continue
+            step(cur)
+            cur.execute('INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)',
+                        (version, name, datetime.utcnow().isoformat()))
+            applied.append(version)
+    if applied:
+        print(f"✅ Applied schema migrations {applied}")
+    return applied
+
+def save_recent(company, tab, prompt, response, user_id=None, created_at=None):
+    now = created_at or datetime.utcnow().isoformat()
+    rec_id = execute('''
+        INSERT INTO recents (company, tab, prompt, response, created_at, user_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (company, tab, prompt, compress_text(response), now, user_id))
+    _notify_saved([(rec_id, company, tab, prompt, now, user_id)])
+
+def save_recents(rows):
+    """
+    Insert many (company, tab, prompt, response[, created_at[, user_id]]) rows
+    in a single transaction; rows without created_at get the current time.
+    """
+    now = datetime.utcnow().isoformat()
+    rows = [
+        (company, tab, prompt, compress_text(response), (rest[0] if rest else None) or now,
+         rest[1] if len(rest) > 1 else None)
+        for company, tab, prompt, response, *rest in rows
+    ]
+    with transaction() as cur:
+        cur.executemany('''
+            INSERT INTO recents (company, tab, prompt, response, created_at, user_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+        # One write transaction, so the new ids are consecutive and end at last_insert_rowid()
+        last_id = cur.execute('SELECT last_insert_rowid()').fetchone()[0]
+    first_id = last_id - len(rows) + 1
+    _notify_saved([(first_id + i, r[0], r[1], r[2], r[4], r[5]) for i, r in enumerate(rows)])
+
+def get_recents(user_id, limit=50, before_id=None, company=None, tab=None, summary=False):
+    """
+    Newest-first page of user_id's recents, read along idx_recents_user_id (or
+    the per-user company/tab ones when filtering). Pass the last id of a page as
+    before_id to get the next one. With summary=True the response column holds
+    only a preview of RECENT_PREVIEW_CHARS characters, plus one extra so
+    callers can tell it was cut.
+    """
+    where, params = ['user_id = ?'], [user_id]
+    if before_id is not None:
+        where.append('id < ?')
+        params.append(before_id)
+    if company:
+        where.append('company = ?')
+        params.append(company)
+    if tab:
+        where.append('tab = ?')
+        params.append(tab)
+
+    if summary:
+        response_col = 'substr(recent_text(response), 1, ?)'
+        params.insert(0, RECENT_PREVIEW_CHARS + 1)
+    else:
+        response_col = 'recent_text(response)'
+
+    sql = f'''
+        SELECT id, company, tab, prompt, {response_col}, created_at
         FROM recents
+        WHERE {' AND '.join(where)}
         ORDER BY id DESC
         LIMIT ?
-    ''', (limit,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
-
-def remove_recent(rec_id):
-    import sqlite3
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM recents WHERE id = ?", (rec_id,))
-    conn.commit()
-    conn.close()
-
-def add_favourite(company_id, company_name):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    # insert or update if already exists
-    cur.execute('''
-        INSERT INTO company (company_id, company_name, isFavourite, created_at)
-        VALUES (?, ?, 1, ?)
-        ON CONFLICT(company_name) DO UPDATE SET isFavourite = 1
-    ''', (company_id, company_name, datetime.utcnow().isoformat()))
+    '''
+    return query(sql, (*params, limit))
 
-    conn.commit()
-    conn.close()
+def iter_recents(user_id, company=None, tab=None, since=None, until=None, batch=RECENTS_EXPORT_BATCH):
+    """
+    Yield lists of up to `batch` of user_id's recents rows, oldest first, straight off
+    one cursor with fetchmany, so memory stays flat however many rows match.
+    since/until bound created_at (ISO strings; since inclusive, until exclusive).
+    """
+    where, params = ['user_id = ?'], [user_id]
+    if company:
+        where.append('company = ?')
+        params.append(company)
+    if tab:
+        where.append('tab = ?')
+        params.append(tab)
+    if since:
+        where.append('created_at >= ?')
+        params.append(since)
+    if until:
+        where.append('created_at < ?')
+        params.append(until)
 
+    cur = get_conn().execute(f'''
+        SELECT id, company, tab, prompt, recent_text(response), created_at
+        FROM recents
+        WHERE {' AND '.join(where)}
+        ORDER BY id
+    ''', params)
+    try:
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cur.close()
 
-def remove_favourite(company_id):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute('''
-        UPDATE company
-        SET isFavourite = 0
-        WHERE company_id = ?
-    ''', (company_id,))
-    conn.commit()
-    conn.close()
+def get_recent(rec_id, user_id=None):
+    """One recent with its full answer; with user_id, only if it is that user's."""
+    if user_id is None:
+        return query_one('''
+            SELECT id, company, tab, prompt, recent_text(response), created_at
+            FROM recents
+            WHERE id = ?
+        ''', (rec_id,))
+    return query_one('''
+        SELECT id, company, tab, prompt, recent_text(response), created_at
+        FROM recents
+        WHERE id = ? AND user_id = ?
+    ''', (rec_id, user_id))
+
+def latest_answer(user_id, company, tab):
+    """
+    (response, created_at) of user_id's newest saved answer for company/tab, or
+    None, read along idx_recents_user_company_tab_id. Skips rows holding
+    bracketed error text such as "[Groq API error 429] ...", which older
+    versions saved as if they were answers.
+    """
+    return query_one('''
+        SELECT recent_text(response), created_at
+        FROM recents
+        WHERE user_id = ? AND company = ? AND tab = ? AND recent_text(response) NOT LIKE '[%'
+        ORDER BY id DESC
+        LIMIT 1
+    ''', (user_id, company, tab))
+
+def rebuild_recents_fts():
+    """Re-index every row of recents from scratch."""
+    with transaction() as cur:
+        cur.execute("INSERT INTO recents_fts (recents_fts) VALUES ('rebuild')")
+
+def _fts_query(text, user_id):
+    # Quote each word so user input can't inject FTS syntax; prefix-match the last one.
+    # The terms only match prompt/response, and only rows whose owner is user_id.
+    terms = re.findall(r"\w+", text or "")
+    if not terms:
+        return None
+    quoted = ['"%s"' % t for t in terms]
+    quoted[-1] += '*'
+    owner = '"%s"' % user_id.replace('"', '""')
+    return 'owner:%s AND {prompt response}:(%s)' % (owner, ' '.join(quoted))
+
+def _highlight(snippet):
+    # snippet() copies the stored text verbatim, so escape it and only then turn
+    # the sentinel marks into <mark> tags
+    return html.escape(snippet or '').replace(_MARK_OPEN, '<mark>').replace(_MARK_CLOSE, '</mark>')
 
+def search_recents(user_id, text, limit=20):
+    """
+    BM25-ranked matches in user_id's recents over prompt (weighted x2) and
+    response, with HTML-escaped snippets whose matched terms are in <mark>.
+    The owner filter is part of the MATCH, so other users' rows are never
+    ranked. Supabase user ids are UUIDs, whose phrase match is exact; the
+    user_id check on the join is only a guard.
+    """
+    match = _fts_query(text, user_id)
+    if match is None:
+        return []
+    # Ranked and cut to `limit` inside FTS5, so snippets are only built for those rows
+    rows = query('''
+        SELECT r.id, r.company, r.tab, hits.prompt_snippet, hits.response_snippet,
+               r.created_at, hits.rank
+        FROM (
+            SELECT rowid,
+                   snippet(recents_fts, 0, ?, ?, '…', 16) AS prompt_snippet,
+                   snippet(recents_fts, 1, ?, ?, '…', 32) AS response_snippet,
+                   rank
+            FROM recents_fts
+            WHERE recents_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        ) AS hits
+        JOIN recents r ON r.id = hits.rowid
+        WHERE r.user_id = ?
+        ORDER BY hits.rank
+    ''', (_MARK_OPEN, _MARK_CLOSE, _MARK_OPEN, _MARK_CLOSE, match, limit, user_id))
+    return [(r[0], r[1], r[2], _highlight(r[3]), _highlight(r[4]), r[5], r[6]) for r in rows]
 
-def get_favourites():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+def remove_recent(rec_id, user_id):
+    execute("DELETE FROM recents WHERE id = ? AND user_id = ?", (rec_id, user_id))
+
+def add_favourite(user_id, company_id, company_name):
+    now = datetime.utcnow().isoformat()
+    with transaction() as cur:
+        # The catalog row, created if this is a company we have not seen yet
+        cur.execute('''
+            INSERT INTO company (company_id, company_name, isFavourite, created_at, updated_at)
+            VALUES (?, ?, 0, ?, ?)
+            ON CONFLICT(company_name) DO NOTHING
+        ''', (company_id or None, company_name, now, now))
+        # By the unique name, not a scan for company_id IS NULL (which has no index)
+        cur.execute('UPDATE company SET company_id = id WHERE company_name = ? AND company_id IS NULL',
+                    (company_name,))
+        cur.execute('''
+            INSERT OR IGNORE INTO user_favourites (user_id, company_id, created_at)
+            SELECT ?, id, ? FROM company WHERE company_name = ?
+        ''', (user_id, now, company_name))
+
+
+def remove_favourite(user_id, company_name):
+    execute('''
+        DELETE FROM user_favourites
+        WHERE user_id = ? AND company_id = (SELECT id FROM company WHERE company_name = ?)
+    ''', (user_id, company_name))
+
+
+def get_favourites(user_id):
+    """
+    (company_id, company_name, created_at, briefing, briefing_at) of user_id's
+    favourites, newest first; briefing is None until one has been generated.
+    """
+    return query('''
+        SELECT c.company_id, c.company_name, f.created_at, recent_text(b.briefing), b.generated_at
+        FROM user_favourites f
+        JOIN company c ON c.id = f.company_id
+        LEFT JOIN company_briefings b ON b.company_id = f.company_id
+        WHERE f.user_id = ?
+        ORDER BY f.created_at DESC
+    ''', (user_id,))
+
+
+def get_favourite_companies():
+    """Names of companies at least one user has favourited."""
+    return [r[0] for r in query('''
+        SELECT company_name FROM company
+        WHERE id IN (SELECT company_id FROM user_favourites)
+    ''')]
+
+
+def briefings_due(older_than, limit):
+    """
+    (company id, name) of favourited companies with no briefing, or one
+    generated before older_than (ISO time); missing ones first, then oldest.
+    """
+    return query('''
+        SELECT c.id, c.company_name
+        FROM company c
+        LEFT JOIN company_briefings b ON b.company_id = c.id
+        WHERE c.id IN (SELECT company_id FROM user_favourites)
+          AND (b.generated_at IS NULL OR b.generated_at < ?)
+        ORDER BY b.generated_at IS NOT NULL, b.generated_at
+        LIMIT ?
+    ''', (older_than, limit))
+
+
+def save_briefing(company_id, briefing):
+    execute('''
+        INSERT INTO company_briefings (company_id, briefing, generated_at)
+        VALUES (?, ?, ?)
+        ON CONFLICT(company_id) DO UPDATE SET
+            briefing = excluded.briefing,
+            generated_at = excluded.generated_at
+    ''', (company_id, compress_text(briefing), datetime.utcnow().isoformat()))
+
+
+def _assign_legacy_rows(cur, user_id):
+    cur.execute('UPDATE recents SET user_id = ? WHERE user_id IS NULL', (user_id,))
     cur.execute('''
-        SELECT company_id, company_name, created_at
-        FROM company
-        WHERE isFavourite = 1
-        ORDER BY id DESC
-    ''')
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+        INSERT OR IGNORE INTO user_favourites (user_id, company_id, created_at)
+        SELECT ?, id, created_at FROM company WHERE isFavourite = 1
+    ''', (user_id,))
+    cur.execute('UPDATE company SET isFavourite = 0 WHERE isFavourite = 1')
+
+
+def assign_legacy_rows(user_id):
+    """Give recents and favourites saved before per-user storage to user_id."""
+    with transaction() as cur:
+        _assign_legacy_rows(cur, user_id)
+
+
+if __name__ == '__main__':
+    # python models.py assign-legacy <supabase user id>
+    import sys
+    if len(sys.argv) != 3 or sys.argv[1] != 'assign-legacy':
+        sys.exit("usage: python models.py assign-legacy <user_id>")
+    init_db()
+    assign_legacy_rows(sys.argv[2])
+    print(f"Assigned legacy recents and favourites to {sys.argv[2]}")
@@ -0,0 +1,163 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from logs import get_logger, log_event
+from singleflight import SingleFlight
+from upstream import newsapi_http
+
+NEWSAPI_URL = os.getenv("NEWSAPI_URL", "https://newsapi.org/v2/everything")
+NEWS_ARTICLES = int(os.getenv("NEWS_ARTICLES", "5"))
+# Fresh for NEWS_TTL; after that served as-is while a background refresh runs,
+# until NEWS_STALE_TTL when a caller has to wait for a new fetch.
+NEWS_TTL = int(os.getenv("NEWS_TTL", "600"))
+NEWS_STALE_TTL = int(os.getenv("NEWS_STALE_TTL", "3600"))
+NEWS_ERROR_TTL = int(os.getenv("NEWS_ERROR_TTL", "60"))
+NEWS_REFRESH_INTERVAL = int(os.getenv("NEWS_REFRESH_INTERVAL", "300"))
+NEWS_FETCH_WORKERS = int(os.getenv("NEWS_FETCH_WORKERS", "4"))
+NEWS_BATCH_MAX = int(os.getenv("NEWS_BATCH_MAX", "25"))
+
+log = get_logger("news")
+
+
+def fetch_news(company_name):
+    """Latest articles for company_name from NewsAPI, or None if the call failed."""
+    params = {'q': company_name, 'sortBy': 'publishedAt', 'language': 'en', 'apiKey': os.getenv("NEWSAPI_KEY")}
+    try:
+        r = newsapi_http.get(NEWSAPI_URL, params=params)
+        if r.status_code != 200:
+            log_event(log, "newsapi_error", level=logging.WARNING, status=r.status_code, company=company_name)
+            return None
+        resp = r.json()
+        return [
+            {
+                "title": a.get("title"),
+                "url": a.get("url"),
+                "source": a.get("source", {}).get("name"),
+                "publishedAt": a.get("publishedAt")
+            }
+            for a in resp.get("articles", [])[:NEWS_ARTICLES]
+        ]
+    except Exception as e:
+        log_event(log, "newsapi_error", level=logging.WARNING, error=str(e), company=company_name)
+        return None
+
+
+class NewsCache:
+    """Per-company article cache with TTL and stale-while-revalidate."""
+
+    def __init__(self, fetch=fetch_news, ttl=NEWS_TTL, stale_ttl=NEWS_STALE_TTL, error_ttl=NEWS_ERROR_TTL):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.error_ttl = error_ttl
+        self._entries = {}  # key -> (articles, fetched_at, ok)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=NEWS_FETCH_WORKERS, thread_name_prefix="news-fetch")
+        self._stats = {'fresh_hits': 0, 'stale_hits': 0, 'misses': 0, 'fetches': 0, 'fetch_errors': 0}
+        # Concurrent misses for the same company share one NewsAPI call
+        self._flight = SingleFlight("news")
+
+    @staticmethod
+    def _key(company_name):
+        return " ".join(company_name.lower().split())
+
+    def get(self, company_name):
+        key = self._key(company_name)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            articles, fetched_at, ok = entry
+            age = now - fetched_at
+            if age < (self.ttl if ok else self.error_ttl):
+                self._count('fresh_hits')
+                return articles
+            if ok and age < self.stale_ttl:
+                self._count('stale_hits')
+                self.refresh_async(company_name)
+                return articles
+        self._count('misses')
+        return self.refresh(company_name)
+
+    def get_many(self, company_names):
+        """Articles for each name, in order; misses are fetched in parallel."""
+        futures = [self._pool.submit(self.get, name) for name in company_names]
+        return [f.result() for f in futures]
+
+    def refresh(self, company_name):
+        key = self._key(company_name)
+        articles, _ = self._flight.do(key, lambda: self._fetch_and_store(key, company_name))
+        return articles
+
+    def _fetch_and_store(self, key, company_name):
+        articles = self.fetch(company_name)
+        self._count('fetches')
+        with self._lock:
+            if articles is None:
+                self._stats['fetch_errors'] += 1
+                previous = self._entries.get(key)
+                if previous is not None and previous[2]:
+                    # Keep serving the last good articles instead of caching the failure
+                    return previous[0]
+                self._entries[key] = ([], time.time(), False)
+                return []
+            self._entries[key] = (articles, time.time(), True)
+            return articles
+
+    def refresh_async(self, company_name):
+        key = self._key(company_name)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self.refresh(company_name)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._pool.submit(run)
+
+    def needs_refresh(self, company_name, margin=0.8):
+        with self._lock:
+            entry = self._entries.get(self._key(company_name))
+        return entry is None or time.time() - entry[1] >= self.ttl * margin
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+news_cache = NewsCache()
+
+
+def _warm_favourites(get_companies):
+    while True:
+        try:
+            for name in get_companies():
+                if name and news_cache.needs_refresh(name):
+                    news_cache.refresh_async(name)
+        except Exception as e:
+            log_event(log, "news_refresher_error", level=logging.ERROR, error=str(e))
+        time.sleep(NEWS_REFRESH_INTERVAL)
+
+
+def start_refresher(get_companies):
+    """Keep news warm for every company get_companies() returns (e.g. favourites)."""
+    if NEWS_REFRESH_INTERVAL <= 0:
+        return None
+    t = threading.Thread(target=_warm_favourites, args=(get_companies,), name="news-refresher", daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,264 @@
+import logging
+import os
+import select
+import signal
+import subprocess
+import sys
+import time
+
+from logs import get_logger, log_event
+
+# Worker processes for `python server.py --workers N`; 1 serves in-process
+SERVER_PROCESSES = int(os.getenv("SERVER_PROCESSES", "1"))
+# How long a new worker may take to start accepting during a rolling restart
+WORKER_READY_TIMEOUT = float(os.getenv("WORKER_READY_TIMEOUT", "30"))
+# How long stopping workers get to drain in-flight requests before SIGKILL
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", "30"))
+# A worker dying sooner than this after starting counts as a crash loop
+WORKER_MIN_UPTIME = 5.0
+WORKER_RESTART_BACKOFF_MAX = 30.0
+
+# Handed from a supervisor to the one it re-execs: the listening socket's fd,
+# and "slot:pid,..." of the workers still serving the old code
+LISTEN_FD_ENV = "STOCKIN_LISTEN_FD"
+INHERITED_WORKERS_ENV = "STOCKIN_INHERITED_WORKERS"
+
+log = get_logger("prefork")
+
+
+class Worker:
+    __slots__ = ('slot', 'pid', 'started', 'ready_fd', 'retiring')
+
+    def __init__(self, slot, pid, ready_fd):
+        self.slot = slot
+        self.pid = pid
+        self.started = time.monotonic()
+        self.ready_fd = ready_fd
+        self.retiring = False
+
+
+class Supervisor:
+    """
+    Pre-fork supervisor. The parent binds the listening socket and does any
+    one-off setup (schema, static preload), then forks `processes` workers
+    that each call worker_main(slot, notify_ready) and accept on the inherited
+    socket. Crashed workers are restarted with backoff. SIGTERM/SIGINT stop
+    every worker gracefully.
+
+    SIGHUP deploys: once `exec_argv + ['--check']` succeeds (the new code
+    imports and its config loads), the supervisor execs exec_argv with
+    exec_env, handing over listen_fd and its workers. The new supervisor then
+    replaces those workers one at a time, retiring each only once its
+    replacement is accepting, so there is always a process on the socket.
+    Without exec_argv, SIGHUP only recycles workers from the current image.
+    """
+
+    def __init__(self, processes, worker_main, listen_fd=None, exec_argv=None, exec_env=None,
+                 inherited=()):
+        self.processes = processes
+        self.worker_main = worker_main
+        self.listen_fd = listen_fd
+        self.exec_argv = exec_argv
+        self.exec_env = exec_env
+        self.inherited = list(inherited)  # (slot, pid) left running by the supervisor that exec'd us
+        self.workers = {}       # pid -> Worker
+        self._crashes = {}      # slot -> consecutive quick deaths
+        self._respawn_at = {}   # slot -> monotonic time to respawn
+        self._stop = False
+        self._reload = False
+
+    # --- child side ---
+
+    def _spawn(self, slot):
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            code = 0
+            try:
+                for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+                    signal.signal(sig, signal.SIG_DFL)
+                # Reloads are the supervisor's business
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+                def notify_ready():
+                    try:
+                        os.write(ready_w, b'1')
+                        os.close(ready_w)
+                    except OSError:
+                        pass
+
+                self.worker_main(slot, notify_ready)
+            except BaseException as e:
+                log_event(log, "worker_crashed", level=logging.ERROR, slot=slot, error=repr(e))
+                code = 1
+            finally:
+                # Skip the parent's atexit handlers; worker_main has already cleaned up
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+
+        os.close(ready_w)
+        worker = Worker(slot, pid, ready_r)
+        self.workers[pid] = worker
+        log_event(log, "worker_started", slot=slot, pid=pid)
+        return worker
+
+    # --- parent side ---
+
+    def _wait_ready(self, worker, timeout):
+        ready, _, _ = select.select([worker.ready_fd], [], [], timeout)
+        return bool(ready) and os.read(worker.ready_fd, 1) == b'1'
+
+    def _close_ready_fd(self, worker):
+        if worker.ready_fd is not None:
+            os.close(worker.ready_fd)
+            worker.ready_fd = None
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            self._close_ready_fd(worker)
+            code = os.waitstatus_to_exitcode(status)
+            if worker.retiring or self._stop:
+                log_event(log, "worker_exited", slot=worker.slot, pid=pid, code=code)
+                continue
+
+            uptime = time.monotonic() - worker.started
+            crashes = self._crashes.get(worker.slot, 0) + 1 if uptime < WORKER_MIN_UPTIME else 0
+            self._crashes[worker.slot] = crashes
+            delay = min(WORKER_RESTART_BACKOFF_MAX, 0.5 * (2 ** crashes)) if crashes else 0.0
+            self._respawn_at[worker.slot] = time.monotonic() + delay
+            log_event(log, "worker_died", level=logging.WARNING, slot=worker.slot, pid=pid, code=code,
+                      uptime=round(uptime, 1), restart_in=delay)
+
+    def _respawn_due(self):
+        now = time.monotonic()
+        for slot, at in list(self._respawn_at.items()):
+            if at <= now:
+                del self._respawn_at[slot]
+                self._spawn(slot)
+
+    def _rolling_restart(self, workers=None):
+        workers = list(self.workers.values()) if workers is None else workers
+        log_event(log, "rolling_restart", workers=len(workers))
+        for old in sorted(workers, key=lambda w: w.slot):
+            if self._stop:
+                return
+            new = self._spawn(old.slot)
+            if not self._wait_ready(new, WORKER_READY_TIMEOUT):
+                # Keep serving with the old worker rather than risk an empty socket
+                log_event(log, "rolling_restart_aborted", level=logging.ERROR, slot=new.slot, pid=new.pid)
+                new.retiring = True
+                self._signal(new.pid, signal.SIGKILL)
+                return
+            self._close_ready_fd(new)
+            old.retiring = True
+            self._signal(old.pid, signal.SIGTERM)
+        self._crashes.clear()
+
+    def _reexec(self):
+        """Exec a fresh supervisor on new code and config; returns only if that is not possible."""
+        if not self.exec_argv or self.listen_fd is None:
+            self._rolling_restart()
+            return
+        env = {k: v for k, v in (self.exec_env or os.environ).items()
+               if k not in (LISTEN_FD_ENV, INHERITED_WORKERS_ENV)}
+        check = subprocess.run(self.exec_argv + ['--check'], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if check.returncode != 0:
+            # Keep serving the code we have rather than exec into a crash
+            log_event(log, "reload_aborted", level=logging.ERROR, code=check.returncode,
+                      error=check.stderr.decode('utf-8', 'replace')[-500:])
+            return
+        handover = ','.join(f'{w.slot}:{w.pid}' for w in self.workers.values() if not w.retiring)
+        log_event(log, "supervisor_reexec", workers=handover)
+        env[LISTEN_FD_ENV] = str(self.listen_fd)
+        env[INHERITED_WORKERS_ENV] = handover
+        os.set_inheritable(self.listen_fd, True)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Same pid, so the running workers stay our children; ready pipes are close-on-exec
+        os.execve(self.exec_argv[0], self.exec_argv, env)
+
+    def _adopt(self):
+        # Workers handed over by the previous supervisor keep serving until replaced
+        for slot, pid in self.inherited:
+            worker = Worker(slot, pid, None)
+            if slot >= self.processes:
+                worker.retiring = True
+                self._signal(pid, signal.SIGTERM)
+            self.workers[pid] = worker
+        adopted = [w for w in self.workers.values() if not w.retiring]
+        log_event(log, "workers_adopted", workers=len(adopted))
+        for slot in set(range(self.processes)) - {w.slot for w in adopted}:
+            self._spawn(slot)
+        self._rolling_restart(adopted)
+
+    def _signal(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _shutdown(self):
+        for worker in self.workers.values():
+            self._signal(worker.pid, signal.SIGTERM)
+        deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for worker in list(self.workers.values()):
+            log_event(log, "worker_killed", level=logging.WARNING, slot=worker.slot, pid=worker.pid)
+            self._signal(worker.pid, signal.SIGKILL)
+        while self.workers:
+            pid, _ = os.waitpid(-1, 0)
+            worker = self.workers.pop(pid, None)
+            if worker is not None:
+                self._close_ready_fd(worker)
+
+    def run(self):
+        def _request_stop(signum, frame):
+            self._stop = True
+
+        def _request_reload(signum, frame):
+            self._reload = True
+
+        signal.signal(signal.SIGINT, _request_stop)
+        signal.signal(signal.SIGTERM, _request_stop)
+        signal.signal(signal.SIGHUP, _request_reload)
+
+        try:
+            if self.inherited:
+                self._adopt()
+            else:
+                for slot in range(self.processes):
+                    self._spawn(slot)
+            while not self._stop:
+                self._reap()
+                self._respawn_due()
+                if self._reload:
+                    self._reload = False
+                    self._reexec()
+                time.sleep(0.2)
+        finally:
+            print("Stopping workers")
+            self._shutdown()
+
+
+def inherited_listener():
+    """(listening fd, [(slot, pid), ...]) handed over by a re-exec'ing supervisor, or (None, [])."""
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    workers = os.environ.pop(INHERITED_WORKERS_ENV, '')
+    if fd is None:
+        return None, []
+    pairs = [part.split(':') for part in workers.split(',') if part]
+    return int(fd), [(int(slot), int(pid)) for slot, pid in pairs]
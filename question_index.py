@@ -0,0 +1,267 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+
+from db import query, query_one
+from logs import get_logger, log_event
+from models import on_recents_saved
+from research_cache import normalize, research_cache
+
+log = get_logger("question_index")
+
+# Cosine similarity (TF-IDF) a stored question needs to stand in for a new one; 0 disables
+SIMILAR_QUESTION_THRESHOLD = float(os.getenv("SIMILAR_QUESTION_THRESHOLD", "0.85"))
+# Questions kept per user and company/tab, newest first
+SIMILAR_QUESTION_MAX_DOCS = int(os.getenv("SIMILAR_QUESTION_MAX_DOCS", "500"))
+# Oldest stored answer worth reusing, in seconds; 0 uses the tab's answer-cache TTL
+SIMILAR_QUESTION_MAX_AGE = int(os.getenv("SIMILAR_QUESTION_MAX_AGE", "0"))
+# Newest recents loaded into the index on first use
+SIMILAR_QUESTION_WARM_ROWS = int(os.getenv("SIMILAR_QUESTION_WARM_ROWS", "5000"))
+# Seconds between checks for recents saved by other processes (pre-fork workers)
+SIMILAR_QUESTION_REFRESH = float(os.getenv("SIMILAR_QUESTION_REFRESH", "2"))
+
+# Shared by warm-up and refresh: error text saved by older versions is not a question worth matching
+_ROWS_SQL = '''
+    SELECT id, company, tab, prompt, created_at, user_id FROM recents
+    WHERE {where} AND NOT (typeof(response) = 'text' AND response LIKE '[%')
+    ORDER BY id {order} LIMIT ?
+'''
+
+# Words that say nothing about which fact is being asked for
+STOPWORDS = frozenset("""
+a about an and are as at be by can could did do does for from give had has have how i in is it its
+me much my of on or please show tell than that the their them there these this to was were what
+whats when where which who why will with would you your
+""".split())
+
+
+def _stem(word):
+    # Enough to fold plurals and possessives ("revenues", "teslas" from "tesla's")
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def terms(question, company=''):
+    """Counter of the meaningful, stemmed words of question, minus the company's own name."""
+    skip = {_stem(w) for w in normalize(company).split()}
+    words = (_stem(w) for w in normalize(question).split())
+    return Counter(w for w in words if w not in STOPWORDS and w not in skip)
+
+
+def _numbers(counts):
+    # "q3" vs "q4" or "2023" vs "2024" share every other word; they must agree exactly
+    return frozenset(t for t in counts if any(c.isdigit() for c in t))
+
+
+def _timestamp(created_at):
+    try:
+        return datetime.fromisoformat(created_at).replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _bucket_key(company, tab, user_id):
+    return user_id, normalize(company), normalize(tab)
+
+
+class _Bucket:
+    __slots__ = ('docs', 'postings')
+
+    def __init__(self):
+        self.docs = OrderedDict()  # recents id -> (term counts, saved at, numeric terms)
+        self.postings = {}         # term -> set of recents ids
+
+
+class QuestionIndex:
+    """
+    Incremental TF-IDF index of saved questions, one bucket per user and
+    company/tab. find() returns the user's saved question most similar to a
+    new one, if it clears the threshold, so its answer can be reused instead of
+    asking Groq again; one user's history never answers another's question.
+    Rows saved in this process arrive through the save hook; rows saved by
+    other workers are read from recents by id at most every refresh_every
+    seconds, on lookup.
+    """
+
+    def __init__(self, threshold=SIMILAR_QUESTION_THRESHOLD, max_docs=SIMILAR_QUESTION_MAX_DOCS,
+                 max_age=SIMILAR_QUESTION_MAX_AGE, warm_rows=SIMILAR_QUESTION_WARM_ROWS,
+                 refresh_every=SIMILAR_QUESTION_REFRESH):
+        self.threshold = threshold
+        self.max_docs = max_docs
+        self.max_age = max_age
+        self.warm_rows = warm_rows
+        self.refresh_every = refresh_every
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget every indexed question; the next lookup warms up from recents again."""
+        with self._lock:
+            self._buckets = {}
+            self._df = Counter()  # term -> number of indexed questions containing it
+            self._total = 0
+            self._warmed = False
+            self._seen_id = 0     # every recents id up to this one has been read from the table
+            self._checked = 0.0
+            self._stats = {'lookups': 0, 'matches': 0, 'indexed': 0, 'refreshes': 0}
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def add_rows(self, rows):
+        """Index [(id, company, tab, question, created_at, user_id), ...]; used as the save hook."""
+        # Until the first lookup warms the index, saved rows are picked up from the table then
+        if not self.enabled or not self._warmed:
+            return
+        with self._lock:
+            for rec_id, company, tab, question, created_at, user_id in rows:
+                self._add(rec_id, company, tab, question, _timestamp(created_at), user_id)
+
+    def discard(self, company, tab, rec_id, user_id):
+        with self._lock:
+            bucket = self._buckets.get(_bucket_key(company, tab, user_id))
+            if bucket is not None and rec_id in bucket.docs:
+                self._remove(bucket, rec_id)
+
+    def find(self, company, tab, question, user_id):
+        """(recents id, score) of user_id's best match at or above the threshold, or None."""
+        if not self.enabled:
+            return None
+        self._warm()
+        if time.monotonic() - self._checked > self.refresh_every:
+            self._refresh()
+        q = terms(question, company)
+        if not q:
+            return None
+        max_age = self.max_age or research_cache.ttl_for(tab)
+        if max_age <= 0:
+            return None
+        oldest = time.time() - max_age
+        q_numbers = _numbers(q)
+
+        with self._lock:
+            self._stats['lookups'] += 1
+            bucket = self._buckets.get(_bucket_key(company, tab, user_id))
+            if bucket is None:
+                return None
+            q_vec = self._weights(q)
+            q_norm = math.sqrt(sum(w * w for w in q_vec.values()))
+            candidates = set()
+            for term in q:
+                candidates |= bucket.postings.get(term, set())
+
+            best_id, best_score = None, 0.0
+            for rec_id in candidates:
+                counts, saved_at, numbers = bucket.docs[rec_id]
+                if saved_at < oldest or numbers != q_numbers:
+                    continue
+                d_vec = self._weights(counts)
+                dot = sum(w * d_vec.get(t, 0.0) for t, w in q_vec.items())
+                d_norm = math.sqrt(sum(w * w for w in d_vec.values()))
+                score = dot / (q_norm * d_norm) if q_norm and d_norm else 0.0
+                # Ties go to the newer answer
+                if score > best_score or (score == best_score and best_id is not None and rec_id > best_id):
+                    best_id, best_score = rec_id, score
+            if best_id is None or best_score < self.threshold:
+                return None
+            self._stats['matches'] += 1
+        return best_id, round(best_score, 4)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['questions'] = self._total
+            stats['buckets'] = len(self._buckets)
+            stats['terms'] = len(self._df)
+        stats['threshold'] = self.threshold
+        return stats
+
+    # --- internals (callers hold self._lock) ---
+
+    def _weights(self, counts):
+        # Sublinear tf times smoothed idf over every indexed question
+        n = self._total
+        return {t: (1 + math.log(c)) * (math.log((n + 1) / (self._df.get(t, 0) + 1)) + 1)
+                for t, c in counts.items()}
+
+    def _add(self, rec_id, company, tab, question, saved_at, user_id):
+        counts = terms(question, company)
+        if not counts:
+            return
+        key = _bucket_key(company, tab, user_id)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket()
+        if rec_id in bucket.docs:
+            return
+        bucket.docs[rec_id] = (counts, saved_at, _numbers(counts))
+        for term in counts:
+            bucket.postings.setdefault(term, set()).add(rec_id)
+            self._df[term] += 1
+        self._total += 1
+        self._stats['indexed'] += 1
+        while len(bucket.docs) > self.max_docs:
+            self._remove(bucket, next(iter(bucket.docs)))
+
+    def _remove(self, bucket, rec_id):
+        counts, _, _ = bucket.docs.pop(rec_id)
+        for term in counts:
+            ids = bucket.postings.get(term)
+            if ids is not None:
+                ids.discard(rec_id)
+                if not ids:
+                    del bucket.postings[term]
+            self._df[term] -= 1
+            if self._df[term] <= 0:
+                del self._df[term]
+        self._total -= 1
+
+    def _warm(self):
+        if self._warmed:
+            return
+        with self._lock:
+            if self._warmed:
+                return
+            started = time.perf_counter()
+            try:
+                newest = query_one('SELECT COALESCE(MAX(id), 0) FROM recents')[0]
+                rows = query(_ROWS_SQL.format(where='id <= ?', order='DESC'), (newest, self.warm_rows))
+            except Exception as e:
+                log_event(log, "question_index_warm_failed", level=logging.WARNING, error=str(e))
+                return
+            # Oldest first, so each bucket's insertion order matches its eviction order
+            for rec_id, company, tab, question, created_at, user_id in reversed(rows):
+                self._add(rec_id, company, tab, question, _timestamp(created_at), user_id)
+            self._seen_id = newest
+            self._checked = time.monotonic()
+            self._warmed = True
+        log_event(log, "question_index_warmed", rows=len(rows),
+                  seconds=round(time.perf_counter() - started, 4))
+
+    def _refresh(self):
+        # Ids are handed out in commit order, so everything another worker saved
+        # since the last look has an id above _seen_id. Rows this process saved
+        # come back too and are skipped as already indexed.
+        self._checked = time.monotonic()
+        try:
+            rows = query(_ROWS_SQL.format(where='id > ?', order='ASC'), (self._seen_id, self.warm_rows))
+        except Exception as e:
+            log_event(log, "question_index_refresh_failed", level=logging.WARNING, error=str(e))
+            return
+        if not rows:
+            return
+        with self._lock:
+            self._stats['refreshes'] += 1
+            for rec_id, company, tab, question, created_at, user_id in rows:
+                self._add(rec_id, company, tab, question, _timestamp(created_at), user_id)
+            self._seen_id = max(self._seen_id, rows[-1][0])
+
+
+question_index = QuestionIndex()
+on_recents_saved(question_index.add_rows)
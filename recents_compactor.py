@@ -0,0 +1,239 @@
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from compression import compress_text, RECENTS_COMPRESSION
+from db import get_conn, transaction, query, query_one, with_retry
+from logs import get_logger, log_event
+
+log = get_logger("recents_compactor")
+
+# Retention: 0 keeps rows forever / keeps every row a user has for a company
+RECENTS_MAX_AGE_DAYS = float(os.getenv("RECENTS_MAX_AGE_DAYS", "0"))
+RECENTS_MAX_PER_COMPANY = int(os.getenv("RECENTS_MAX_PER_COMPANY", "0"))
+# Seconds between compaction passes; 0 disables the background compactor
+RECENTS_COMPACT_INTERVAL = float(os.getenv("RECENTS_COMPACT_INTERVAL", "3600"))
+# Rows deleted or recompressed per write transaction, so requests can get the lock in between
+RECENTS_COMPACT_BATCH = int(os.getenv("RECENTS_COMPACT_BATCH", "500"))
+# Pages returned to the filesystem per incremental_vacuum step
+RECENTS_VACUUM_STEP_PAGES = int(os.getenv("RECENTS_VACUUM_STEP_PAGES", "2000"))
+
+# Highest recents id compress_existing() has looked at in this process
+_compressed_through = 0
+_conversion_logged = False
+
+
+def _delete_ids(ids):
+    with transaction() as cur:
+        cur.executemany('DELETE FROM recents WHERE id = ?', [(i,) for i in ids])
+    return len(ids)
+
+
+def expire_old(max_age_days, batch=RECENTS_COMPACT_BATCH):
+    """Delete recents older than max_age_days, oldest first. Returns rows deleted."""
+    cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat()
+    deleted = 0
+    while True:
+        ids = [r[0] for r in query(
+            'SELECT id FROM recents WHERE created_at < ? ORDER BY id LIMIT ?', (cutoff, batch))]
+        if not ids:
+            return deleted
+        deleted += with_retry(lambda: _delete_ids(ids))
+
+
+def trim_companies(max_rows, batch=RECENTS_COMPACT_BATCH):
+    """
+    Keep only each user's newest max_rows recents per company, so one heavy
+    user's history never pushes out another's. Returns rows deleted.
+    """
+    deleted = 0
+    for user_id, company in query('SELECT DISTINCT user_id, company FROM recents'):
+        # Everything at or below the id of the (max_rows + 1)th newest row goes
+        row = query_one('''
+            SELECT id FROM recents WHERE user_id IS ? AND company IS ?
+            ORDER BY id DESC LIMIT 1 OFFSET ?
+        ''', (user_id, company, max_rows))
+        if row is None:
+            continue
+        while True:
+            ids = [r[0] for r in query('''
+                SELECT id FROM recents WHERE user_id IS ? AND company IS ? AND id <= ?
+                ORDER BY id LIMIT ?
+            ''', (user_id, company, row[0], batch))]
+            if not ids:
+                break
+            deleted += with_retry(lambda: _delete_ids(ids))
+    return deleted
+
+
+def compress_existing(batch=RECENTS_COMPACT_BATCH, limit=None):
+    """
+    Compress answers stored as plain TEXT (saved before compression was on).
+    Rows too short to benefit stay TEXT; each pass starts after the last id
+    the previous one reached in this process, so they are read once per
+    process rather than every hour. Returns rows rewritten.
+    """
+    global _compressed_through
+    if RECENTS_COMPRESSION == 'none':
+        return 0
+    rewritten = 0
+    last_id = _compressed_through
+    while limit is None or rewritten < limit:
+        rows = query('''
+            SELECT id, response FROM recents
+            WHERE id > ? AND typeof(response) = 'text'
+            ORDER BY id LIMIT ?
+        ''', (last_id, batch))
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        _compressed_through = last_id
+        updates = []
+        for rec_id, text in rows:
+            packed = compress_text(text)
+            if packed is not text:
+                updates.append((packed, rec_id))
+        if updates:
+            def write():
+                with transaction() as cur:
+                    cur.executemany('UPDATE recents SET response = ? WHERE id = ?', updates)
+            with_retry(write)
+            rewritten += len(updates)
+    return rewritten
+
+
+def _pragma(name):
+    return get_conn().execute(f'PRAGMA {name}').fetchone()[0]
+
+
+def reclaim_space(step_pages=RECENTS_VACUUM_STEP_PAGES):
+    """
+    Return free pages to the filesystem with incremental VACUUM. A database
+    created before auto_vacuum=INCREMENTAL has no incremental mode; it is left
+    alone (and logged once) until convert_auto_vacuum() is run offline.
+    Returns bytes reclaimed.
+    """
+    global _conversion_logged
+    if _pragma('auto_vacuum') != 2:
+        if not _conversion_logged:
+            _conversion_logged = True
+            log_event(log, "auto_vacuum_conversion_needed", level=logging.WARNING,
+                      hint="stop the server and run python recents_compactor.py --convert")
+        return 0
+    conn = get_conn()
+    page_size = _pragma('page_size')
+    before = _pragma('page_count')
+    while _pragma('freelist_count'):
+        # Short steps so writers are not locked out for the whole pass
+        with_retry(lambda: conn.execute(f'PRAGMA incremental_vacuum({step_pages})').fetchall())
+    with_retry(lambda: conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall())
+    return (before - _pragma('page_count')) * page_size
+
+
+def convert_auto_vacuum():
+    """
+    Switch an older database to auto_vacuum=INCREMENTAL with one full VACUUM.
+    That rewrites the whole file and blocks every writer until it is done, so
+    run it with the server stopped. Returns False if already converted.
+    """
+    if _pragma('auto_vacuum') == 2:
+        return False
+    conn = get_conn()
+    started = time.perf_counter()
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    conn.execute('VACUUM')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    log_event(log, "auto_vacuum_converted", pages=_pragma('page_count'),
+              seconds=round(time.perf_counter() - started, 3))
+    return True
+
+
+def compact(max_age_days=RECENTS_MAX_AGE_DAYS, max_per_company=RECENTS_MAX_PER_COMPANY):
+    """One retention + compression + vacuum pass. Returns a summary dict."""
+    started = time.perf_counter()
+    result = {'expired': 0, 'trimmed': 0, 'compressed': 0}
+    if max_age_days > 0:
+        result['expired'] = expire_old(max_age_days)
+    if max_per_company > 0:
+        result['trimmed'] = trim_companies(max_per_company)
+    result['compressed'] = compress_existing()
+    result['bytes_reclaimed'] = reclaim_space()
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+class RecentsCompactor:
+    """Background thread running compact() every `interval` seconds."""
+
+    def __init__(self, interval=RECENTS_COMPACT_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'runs': 0, 'errors': 0, 'expired': 0, 'trimmed': 0, 'compressed': 0,
+                       'bytes_reclaimed': 0, 'last_run': None, 'last_result': None}
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running or self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="recents-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def run_once(self):
+        try:
+            result = compact()
+        except Exception as e:
+            with self._lock:
+                self._stats['errors'] += 1
+            log_event(log, "recents_compact_error", level=logging.WARNING, error=str(e))
+            return None
+        with self._lock:
+            self._stats['runs'] += 1
+            for key in ('expired', 'trimmed', 'compressed', 'bytes_reclaimed'):
+                self._stats[key] += result[key]
+            self._stats['last_run'] = datetime.utcnow().isoformat()
+            self._stats['last_result'] = result
+        log_event(log, "recents_compacted", **result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['running'] = self.running
+        return stats
+
+    def _run(self):
+        # First pass shortly after start-up, then every interval
+        if self._stop.wait(min(60, self.interval)):
+            return
+        while True:
+            self.run_once()
+            if self._stop.wait(self.interval):
+                return
+
+
+recents_compactor = RecentsCompactor()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--convert']:
+        # Offline, with the server stopped: python recents_compactor.py --convert
+        print("Converted to auto_vacuum=INCREMENTAL" if convert_auto_vacuum() else "Already incremental")
+    else:
+        # One pass by hand, e.g. from cron with RECENTS_COMPACT_INTERVAL=0 on the server
+        print(recents_compactor.run_once())
@@ -0,0 +1,150 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from logs import get_logger, log_event
+from models import save_recent, save_recents
+
+log = get_logger("recents_writer")
+
+# Off by default: research results are saved before the response is sent.
+# When on, they go onto a bounded queue that a background thread flushes in
+# batches of RECENTS_WRITE_BATCH rows or every RECENTS_WRITE_INTERVAL seconds.
+RECENTS_WRITE_BEHIND = os.getenv("RECENTS_WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+RECENTS_WRITE_BATCH = int(os.getenv("RECENTS_WRITE_BATCH", "100"))
+RECENTS_WRITE_INTERVAL = float(os.getenv("RECENTS_WRITE_INTERVAL", "0.5"))
+RECENTS_WRITE_QUEUE_MAX = int(os.getenv("RECENTS_WRITE_QUEUE_MAX", "10000"))
+# How long a request may block on a full queue before writing synchronously itself
+RECENTS_WRITE_PUT_TIMEOUT = float(os.getenv("RECENTS_WRITE_PUT_TIMEOUT", "2"))
+
+_STOP = object()
+
+
+class RecentsWriter:
+    """Background batch writer for the recents table."""
+
+    def __init__(self, batch_size=RECENTS_WRITE_BATCH, interval=RECENTS_WRITE_INTERVAL,
+                 max_queue=RECENTS_WRITE_QUEUE_MAX, put_timeout=RECENTS_WRITE_PUT_TIMEOUT):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'queued': 0, 'written': 0, 'batches': 0, 'sync_fallbacks': 0, 'write_errors': 0}
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="recents-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def put(self, company, tab, prompt, response, user_id=None, created_at=None):
+        row = (company, tab, prompt, response, created_at or datetime.utcnow().isoformat(), user_id)
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            # Backpressure: the writer can't keep up, so pay for this write ourselves
+            self._count('sync_fallbacks')
+            save_recents([row])
+            return
+        self._count('queued')
+
+    def stop(self, timeout=30):
+        """Flush everything still queued, then stop the writer thread."""
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pending'] = self._queue.qsize()
+        stats['running'] = self.running
+        return stats
+
+    def _run(self):
+        stopping = False
+        while True:
+            batch = []
+            if not stopping:
+                try:
+                    first = self._queue.get(timeout=self.interval)
+                except queue.Empty:
+                    continue
+                if first is _STOP:
+                    stopping = True
+                else:
+                    batch.append(first)
+
+            # Gather rows until the batch is full or the interval runs out;
+            # once stopping, just drain whatever is left without waiting
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    if stopping:
+                        row = self._queue.get_nowait()
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        row = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    continue
+                batch.append(row)
+
+            if batch:
+                self._write(batch)
+            elif stopping:
+                return
+
+    def _write(self, batch):
+        attempt = 0
+        while True:
+            try:
+                save_recents(batch)
+                break
+            except Exception as e:
+                self._count('write_errors')
+                attempt += 1
+                log_event(log, "recents_write_error", level=logging.WARNING, attempt=attempt,
+                          rows=len(batch), error=str(e))
+                if attempt >= 5:
+                    log_event(log, "recents_dropped", level=logging.ERROR, rows=len(batch))
+                    return
+                time.sleep(min(5, 0.2 * (2 ** attempt)))
+        with self._lock:
+            self._stats['written'] += len(batch)
+            self._stats['batches'] += 1
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+recents_writer = RecentsWriter()
+
+
+def persist_recent(company, tab, prompt, response, user_id=None, created_at=None):
+    """
+    Save a research result to user_id's recents, via the write-behind queue
+    when it is running. created_at, for a reused answer, is when it was first given.
+    """
+    if recents_writer.running:
+        recents_writer.put(company, tab, prompt, response, user_id, created_at)
+    else:
+        save_recent(company, tab, prompt, response, user_id, created_at)
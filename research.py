@@ -0,0 +1,128 @@
+import os
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import groq_client
+from models import latest_answer, get_recent
+from question_index import question_index
+from research_cache import research_cache, make_key
+from singleflight import SingleFlight
+
+# Upper bound on Groq calls in flight for /api/research/batch, across all batches
+RESEARCH_BATCH_PARALLELISM = int(os.getenv("RESEARCH_BATCH_PARALLELISM", "4"))
+RESEARCH_BATCH_MAX = int(os.getenv("RESEARCH_BATCH_MAX", "20"))
+
+_batch_pool = ThreadPoolExecutor(max_workers=RESEARCH_BATCH_PARALLELISM, thread_name_prefix="research-batch")
+
+# Identical questions asked at the same time share one Groq call
+research_flight = SingleFlight("research")
+
+
+def _ask_groq(company, tab, question):
+    answer, ok = groq_client.ask(groq_client.build_prompt(company, tab, question))
+    if ok:
+        # Cached before the flight ends, so later arrivals hit the cache instead
+        research_cache.set(company, tab, question, answer)
+    return answer, ok
+
+
+def stream_answer(company, tab, question, on_token):
+    """
+    Ask Groq for a streamed answer, calling on_token(text) with each delta.
+    Shares research_flight with answer_question: when the same question is
+    already in flight, streamed or not, waits for that answer and passes it to
+    on_token whole. Returns (answer, ok, partial): answer is the error text when
+    ok is False, and partial says whether some tokens had already been sent.
+    """
+    parts = []
+
+    def run():
+        try:
+            for token in groq_client.stream(groq_client.build_prompt(company, tab, question)):
+                parts.append(token)
+                on_token(token)
+        except RuntimeError as e:
+            return str(e), False
+        answer = ''.join(parts)
+        research_cache.set(company, tab, question, answer)
+        return answer, True
+
+    (answer, ok), shared = research_flight.do(make_key(company, tab, question), run)
+    if shared and ok:
+        on_token(answer)
+    return answer, ok, bool(parts)
+
+
+def cached_answer(company, tab, question, user_id):
+    """
+    (answer, answered_at) for a known answer to the question, or None: the
+    exact-match cache first, then user_id's saved answer to their most similar
+    earlier question for the same company/tab. The latter is not put in the
+    shared cache, where another user asking this exact question would be
+    served it. answered_at is when the answer was first given (ISO, UTC); a
+    reused answer saved to recents keeps it, so it still ages out.
+    """
+    found = research_cache.lookup(company, tab, question)
+    if found is not None:
+        return found[0], datetime.utcfromtimestamp(found[1]).isoformat()
+    match = question_index.find(company, tab, question, user_id)
+    if match is None:
+        return None
+    row = get_recent(match[0], user_id)
+    if row is None:
+        # Trimmed or deleted since it was indexed
+        question_index.discard(company, tab, match[0], user_id)
+        return None
+    return row[4], row[5]
+
+
+def answer_question(company, tab, question, user_id):
+    """
+    Answer from the cache or Groq. Returns (answer, ok, cached, answered_at),
+    answered_at being when a cached or saved answer was first given (None for
+    a fresh one). When Groq fails or is turned away by its guard, user_id's
+    newest saved answer for the same company/tab is returned instead, with ok
+    False; without one, answer is the error text and answered_at None.
+    """
+    found = cached_answer(company, tab, question, user_id)
+    if found is not None:
+        return found[0], True, True, found[1]
+    (answer, ok), _ = research_flight.do(
+        make_key(company, tab, question),
+        lambda: _ask_groq(company, tab, question)
+    )
+    if not ok:
+        saved = latest_answer(user_id, company, tab)
+        if saved is not None:
+            return saved[0], False, False, saved[1]
+    return answer, ok, False, None
+
+
+def clean_item(item):
+    """(company, tab, question) from a request dict, or None if it is incomplete."""
+    if not isinstance(item, dict):
+        return None
+    company = str(item.get('company') or '').strip()
+    tab = str(item.get('tab') or '').strip()
+    question = str(item.get('question') or '').strip()
+    if not company or not question:
+        return None
+    return company, tab, question
+
+
+def answer_batch(items, user_id):
+    """
+    Answer user_id's cleaned items concurrently on the shared batch pool,
+    yielding (index, answer, ok, cached, answered_at) as each one completes.
+    """
+    futures = {
+        _batch_pool.submit(answer_question, *item, user_id): i
+        for i, item in enumerate(items)
+    }
+    for future in as_completed(futures):
+        i = futures[future]
+        try:
+            answer, ok, cached, answered_at = future.result()
+        except Exception as e:
+            answer, ok, cached, answered_at = f"[Research failed: {str(e)}]", False, False, None
+        yield i, answer, ok, cached, answered_at
@@ -0,0 +1,195 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from db import SQLITE_BUSY_TIMEOUT_MS, with_retry
+
+# Seconds an answer stays fresh. RESEARCH_CACHE_TAB_TTLS overrides it per tab,
+# e.g. "News=300,Financials=3600"; a TTL of 0 disables caching for that tab.
+RESEARCH_CACHE_TTL = int(os.getenv("RESEARCH_CACHE_TTL", "900"))
+RESEARCH_CACHE_TAB_TTLS = os.getenv("RESEARCH_CACHE_TAB_TTLS", "News=300,Financials=3600,Forecast=3600")
+RESEARCH_CACHE_MAX_BYTES = int(os.getenv("RESEARCH_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+# Optional on-disk tier that survives restarts: "1" for the default file or a path
+RESEARCH_CACHE_SQLITE = os.getenv("RESEARCH_CACHE_SQLITE", "")
+
+DEFAULT_DISK_PATH = os.path.join(os.path.dirname(__file__), 'research_cache.db')
+
+_APOSTROPHE_RE = re.compile(r"['\u2019]")
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize(text):
+    """Lower-case, drop punctuation and collapse whitespace."""
+    text = _APOSTROPHE_RE.sub("", (text or "").lower())
+    text = _PUNCT_RE.sub(" ", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def make_key(company, tab, question):
+    return "\x1f".join((normalize(company), normalize(tab), normalize(question)))
+
+
+def parse_tab_ttls(spec):
+    ttls = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        tab, ttl = part.split("=", 1)
+        try:
+            ttls[normalize(tab)] = int(ttl)
+        except ValueError:
+            continue
+    return ttls
+
+
+class ResearchCache:
+    """LRU answer cache with per-tab TTLs, a byte cap and an optional SQLite tier."""
+
+    def __init__(self, default_ttl=RESEARCH_CACHE_TTL, tab_ttls=RESEARCH_CACHE_TAB_TTLS,
+                 max_bytes=RESEARCH_CACHE_MAX_BYTES, disk_path=RESEARCH_CACHE_SQLITE):
+        self.default_ttl = default_ttl
+        self.tab_ttls = parse_tab_ttls(tab_ttls) if isinstance(tab_ttls, str) else dict(tab_ttls or {})
+        self.max_bytes = max_bytes
+        if disk_path == "1":
+            disk_path = DEFAULT_DISK_PATH
+        self.disk_path = disk_path or None
+
+        self._entries = OrderedDict()  # key -> (answer, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self._local = threading.local()
+        # Connections opened before a fork; kept so the child never closes them
+        self._inherited = []
+        self._stats = {'hits': 0, 'misses': 0, 'memory_hits': 0, 'disk_hits': 0,
+                       'evictions': 0, 'expired': 0, 'stores': 0}
+
+        if self.disk_path:
+            with_retry(lambda: self._disk_conn().execute('''
+                CREATE TABLE IF NOT EXISTS research_cache (
+                    key TEXT PRIMARY KEY,
+                    answer TEXT,
+                    expires_at REAL
+                )
+            '''))
+
+    def ttl_for(self, tab):
+        return self.tab_ttls.get(normalize(tab), self.default_ttl)
+
+    def get(self, company, tab, question):
+        found = self.lookup(company, tab, question)
+        return found[0] if found else None
+
+    def lookup(self, company, tab, question):
+        """(answer, stored_at as a Unix time) for a fresh entry, or None."""
+        key = make_key(company, tab, question)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                answer, expires_at, _ = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    self._stats['memory_hits'] += 1
+                    return answer, expires_at - self.ttl_for(tab)
+                self._drop(key)
+                self._stats['expired'] += 1
+
+        if self.disk_path:
+            answer, expires_at = self._disk_get(key, now)
+            if answer is not None:
+                with self._lock:
+                    self._put(key, answer, expires_at)
+                    self._stats['hits'] += 1
+                    self._stats['disk_hits'] += 1
+                return answer, expires_at - self.ttl_for(tab)
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def set(self, company, tab, question, answer):
+        ttl = self.ttl_for(tab)
+        if ttl <= 0 or not answer:
+            return
+        key = make_key(company, tab, question)
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._put(key, answer, expires_at)
+            self._stats['stores'] += 1
+        if self.disk_path:
+            self._disk_set(key, answer, expires_at)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['disk_tier'] = bool(self.disk_path)
+        return stats
+
+    # --- internals (callers hold self._lock) ---
+
+    def _put(self, key, answer, expires_at):
+        if key in self._entries:
+            self._drop(key)
+        size = len(key) + len(answer.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (answer, expires_at, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self._stats['evictions'] += 1
+
+    def _drop(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    # --- disk tier ---
+
+    def _disk_conn(self):
+        """This thread's connection to the disk tier, opened once per thread and process."""
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == pid:
+            return conn
+        if conn is not None:
+            self._inherited.append(conn)
+        # Autocommit like db.py: every statement below is its own short write
+        conn = sqlite3.connect(self.disk_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                               isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+        self._local.conn, self._local.pid = conn, pid
+        return conn
+
+    def _disk_get(self, key, now):
+        row = with_retry(lambda: self._disk_conn().execute(
+            'SELECT answer, expires_at FROM research_cache WHERE key = ? AND expires_at > ?',
+            (key, now)
+        ).fetchone())
+        return row if row else (None, None)
+
+    def _disk_set(self, key, answer, expires_at):
+        conn = self._disk_conn()
+        with_retry(lambda: conn.execute(
+            'INSERT OR REPLACE INTO research_cache (key, answer, expires_at) VALUES (?, ?, ?)',
+            (key, answer, expires_at)
+        ))
+        with self._lock:
+            self._disk_writes += 1
+            purge = self._disk_writes % 256 == 0
+        if purge:
+            with_retry(lambda: conn.execute('DELETE FROM research_cache WHERE expires_at <= ?', (time.time(),)))
+
+research_cache = ResearchCache()
@@ -1,78 +1,528 @@
+import startup
 import os
 import json
-import requests
-import mimetypes
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import unquote, urlparse
+import logging
+import argparse
+import csv
+import io
+import socket
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import unquote, urlparse, parse_qs
 from dotenv import load_dotenv
-from models import init_db, save_recent, get_recents, add_favourite, remove_favourite, get_favourites, remove_recent
-from auth_handler import signup_user, login_user, logout_user, check_auth
+from models import init_db, save_recents, get_recents, get_recent, iter_recents, latest_answer, add_favourite, remove_favourite, get_favourites, get_favourite_companies, remove_recent, search_recents, RECENT_PREVIEW_CHARS
+from auth_handler import signup_user, login_user, logout_user, check_auth, user_id_of
+from research_cache import research_cache
+from recents_writer import recents_writer, persist_recent, RECENTS_WRITE_BEHIND
+from recents_compactor import recents_compactor
+from briefings import briefing_scheduler
+from research import answer_question, answer_batch, cached_answer, stream_answer, clean_item, RESEARCH_BATCH_MAX
+from question_index import question_index
+from company_catalog import company_index
+from upstream import all_stats as upstream_stats
+from singleflight import all_stats as single_flight_stats
+from upstream_guard import all_stats as upstream_guard_stats
+from news import news_cache, start_refresher as start_news_refresher, NEWS_BATCH_MAX
+from static_files import StaticFiles, accepts_gzip
+from logs import get_logger, log_event, LOG_SAMPLE_RATE
+from metrics import registry, http_requests, http_latency, route_label
+from serving import (PooledHTTPServer, serve, SERVER_WORKERS, UPSTREAM_WORKERS, KEEPALIVE_TIMEOUT,
+                     KEEPALIVE_MAX_REQUESTS, REQUEST_TIMEOUT, MAX_BODY_BYTES)
+from prefork import Supervisor, SERVER_PROCESSES, inherited_listener
+from db import close_conn
+
+startup.mark('imports')
 
 # Load environment variables
 load_dotenv()
 
-GROQ_KEY = os.getenv("GROQ_API_KEY")
-GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")  # default Groq model
-
-# Initialize the database
+# Initialize the database (a single SELECT when the schema is already current)
 init_db()
+startup.mark('schema')
 
 PROJECT_DIR = os.path.dirname(__file__)
 STATIC_DIR = PROJECT_DIR
+static_files = StaticFiles(STATIC_DIR)
+
+# POST routes that wait on Groq, NewsAPI or Supabase. They share a capped
+# number of worker slots so they can never starve static/local traffic.
+UPSTREAM_ROUTES = {
+    '/api/auth/signup',
+    '/api/auth/login',
+    '/api/auth/logout',
+    '/api/research',
+    '/api/research/stream',
+    '/api/research/batch',
+    '/api/news_for_company',
+    '/api/news_for_companies',
+}
+
+RECENTS_MAX_LIMIT = 200
+
+access_log = get_logger("access")
+log = get_logger("server")
+
+# format -> (Content-Type, file extension) for /api/recents/export
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+EXPORT_COLUMNS = ('id', 'company', 'tab', 'prompt', 'response', 'created_at')
+
+
+def _date_bound(value, end=False):
+    """
+    A created_at bound from a from/to query value: a date (YYYY-MM-DD, where
+    `to` includes the whole day) or a full ISO datetime, compared in UTC.
+    Raises ValueError for anything else.
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.isoformat()
+
+
+def _stats_metrics():
+    """Expose the in-process cache/coalescing counters alongside the histograms."""
+    cache = research_cache.stats()
+    news = news_cache.stats()
+    flights = single_flight_stats()
+    writer = recents_writer.stats()
+    upstreams = upstream_stats()
+    guards = upstream_guard_stats()
+    compactor = recents_compactor.stats()
+    briefings = briefing_scheduler.stats()
+    similar = question_index.stats()
+    return [
+        ('stockin_research_cache_lookups_total', 'counter', 'Answer cache lookups by result.',
+         [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses'])]),
+        ('stockin_research_cache_bytes', 'gauge', 'Bytes held by the answer cache.', [({}, cache['bytes'])]),
+        ('stockin_similar_question_lookups_total', 'counter', 'Near-duplicate question lookups by result.',
+         [({'result': 'match'}, similar['matches']),
+          ({'result': 'miss'}, similar['lookups'] - similar['matches'])]),
+        ('stockin_news_cache_lookups_total', 'counter', 'News cache lookups by result.',
+         [({'result': k}, news[k]) for k in ('fresh_hits', 'stale_hits', 'misses')]),
+        ('stockin_single_flight_coalesced_total', 'counter', 'Calls that waited on an identical in-flight call.',
+         [({'group': g}, v['coalesced']) for g, v in flights.items()]),
+        ('stockin_upstream_retries_total', 'counter', 'Upstream retries after errors or 429/5xx.',
+         [({'upstream': u}, v['retries']) for u, v in upstreams.items()]),
+        ('stockin_upstream_concurrency_limit', 'gauge', 'Current adaptive in-flight limit per upstream.',
+         [({'upstream': u}, v['limit']) for u, v in guards.items()]),
+        ('stockin_upstream_inflight', 'gauge', 'Upstream calls holding a guard slot.',
+         [({'upstream': u}, v['inflight']) for u, v in guards.items()]),
+        ('stockin_upstream_circuit_open', 'gauge', '1 while the upstream circuit breaker is open or half-open.',
+         [({'upstream': u}, int(v['state'] != 'closed')) for u, v in guards.items()]),
+        ('stockin_upstream_rejected_total', 'counter', 'Calls turned away by the upstream guard, by reason.',
+         [({'upstream': u, 'reason': r}, v[r]) for u, v in guards.items()
+          for r in ('circuit_open', 'queue_full', 'queue_timeout')]),
+        ('stockin_recents_compacted_rows_total', 'counter', 'Recents rows removed or recompressed by the compactor.',
+         [({'action': k}, compactor[k]) for k in ('expired', 'trimmed', 'compressed')]),
+        ('stockin_recents_reclaimed_bytes_total', 'counter', 'Bytes returned to the filesystem by incremental VACUUM.',
+         [({}, compactor['bytes_reclaimed'])]),
+        ('stockin_briefings_total', 'counter', 'Favourite-company briefings requested from Groq, by result.',
+         [({'result': 'generated'}, briefings['generated']), ({'result': 'failed'}, briefings['failed'])]),
+        ('stockin_recents_writer_pending', 'gauge', 'Recents rows waiting in the write-behind queue.',
+         [({}, writer['pending'])]),
+    ]
+
+
+registry.register_collector(_stats_metrics)
+
+
+def _recent_to_dict(r, summary=False):
+    rec = {
+        'id': r[0],
+        'company': r[1],
+        'tab': r[2],
+        'prompt': r[3],
+        'response': r[4],
+        'created_at': r[5]
+    }
+    if summary:
+        response = r[4] or ''
+        rec['truncated'] = len(response) > RECENT_PREVIEW_CHARS
+        rec['response'] = response[:RECENT_PREVIEW_CHARS]
+    return rec
 
 
 class SimpleHandler(BaseHTTPRequestHandler):
-    def _set_headers(self, status=200, content_type='application/json'):
+    # Persistent connections: every response is framed by Content-Length or
+    # chunked encoding, so the client knows where it ends
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; on a reused connection Nagle
+    # plus delayed ACKs would hold the body back ~40 ms
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self._served = 0
+        self._holding_upstream = False
+
+    def parse_request(self):
+        # Time from a parsed request line, so time spent waiting for it isn't counted
+        self._started = time.perf_counter()
+        self._status = None
+        self._body = None
+        self._chunked = False
+        self._served += 1
+        self.connection.settimeout(REQUEST_TIMEOUT)
+        return super().parse_request()
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def end_headers(self):
+        if not self.close_connection and (
+                self._served >= KEEPALIVE_MAX_REQUESTS
+                or not getattr(self.server, 'has_spare_workers', lambda _: True)(self._holding_upstream)):
+            self.send_header('Connection', 'close')
+        elif not self.close_connection:
+            if self.request_version == 'HTTP/1.0':
+                # A 1.0 client asked for keep-alive; it has to be told it got it
+                self.send_header('Connection', 'keep-alive')
+            self.send_header('Keep-Alive', f'timeout={int(KEEPALIVE_TIMEOUT)}, max={KEEPALIVE_MAX_REQUESTS - self._served}')
+        super().end_headers()
+
+    def handle_one_request(self):
+        self._started = None
+        # Idle timeout while waiting for the next request on this connection
+        self.connection.settimeout(KEEPALIVE_TIMEOUT if self._served else REQUEST_TIMEOUT)
+        super().handle_one_request()
+        if self._started is not None and getattr(self, '_status', None) is not None:
+            elapsed = time.perf_counter() - self._started
+            route = route_label(self.path)
+            if self._status == 404 and route != 'static':
+                # Keep made-up API paths from creating new label values
+                route = 'unknown'
+            http_requests.inc(method=self.command, route=route, status=self._status)
+            http_latency.observe(elapsed, method=self.command, route=route)
+            log_event(access_log, "request", sample=LOG_SAMPLE_RATE, method=self.command,
+                      path=self.path.split('?', 1)[0], status=self._status, seconds=round(elapsed, 4))
+
+    def log_message(self, format, *args):
+        # Access logging is sampled in handle_one_request instead
+        pass
+
+    def log_error(self, format, *args):
+        log_event(access_log, "http_error", sample=LOG_SAMPLE_RATE, client=self.client_address[0],
+                  message=format % args)
+
+    def _read_body(self):
+        """
+        The request body, read once. Every POST consumes its body before the
+        response, even when the handler never looks at it, so the next request
+        on the connection starts at the right byte.
+        """
+        if self._body is None:
+            length = int(self.headers.get('Content-Length') or 0)
+            self._body = self.rfile.read(length) if length > 0 else b''
+        return self._body
+
+    def _send(self, status, body=b'', content_type='application/json', headers=None):
+        """The one path for non-streamed responses: always sends Content-Length."""
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload).encode('utf-8'), headers=headers)
+
+    def _start_chunked(self, status=200, content_type='text/event-stream', headers=None):
         self.send_response(status)
         self.send_header('Content-Type', content_type)
+        self.send_header('Cache-Control', 'no-cache')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.request_version == 'HTTP/1.0':
+            # No chunked encoding before 1.1: the body ends when the connection closes
+            self.close_connection = True
+            self.send_header('Connection', 'close')
+        else:
+            self._chunked = True
+            self.send_header('Transfer-Encoding', 'chunked')
         self.end_headers()
 
+    def _write_chunk(self, data):
+        if not data:
+            return
+        try:
+            if self._chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            else:
+                self.wfile.write(data)
+            self.wfile.flush()
+        except OSError:
+            # The client is gone; never reuse this connection
+            self.close_connection = True
+            raise
+
+    def _end_chunked(self):
+        if self._chunked:
+            self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def _write_sse(self, payload, event=None):
+        msg = f"event: {event}\n" if event else ""
+        msg += f"data: {json.dumps(payload)}\n\n"
+        self._write_chunk(msg.encode('utf-8'))
+
+    def _stream_export(self, fmt, batches, use_gzip):
+        """Write row batches as NDJSON or CSV chunks, gzipping on the fly if asked."""
+        headers = {'Content-Disposition': f'attachment; filename="recents.{EXPORT_FORMATS[fmt][1]}"'}
+        if use_gzip:
+            headers['Content-Encoding'] = 'gzip'
+            headers['Vary'] = 'Accept-Encoding'
+        self._start_chunked(content_type=EXPORT_FORMATS[fmt][0], headers=headers)
+        # wbits=31: gzip container rather than raw zlib
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+
+        def write(text):
+            data = text.encode('utf-8')
+            if gz is not None:
+                data = gz.compress(data)
+            self._write_chunk(data)
+
+        rows = 0
+        try:
+            if fmt == 'csv':
+                buf = io.StringIO()
+                out = csv.writer(buf)
+                out.writerow(EXPORT_COLUMNS)
+                for batch in batches:
+                    out.writerows(batch)
+                    write(buf.getvalue())
+                    buf.seek(0)
+                    buf.truncate()
+                    rows += len(batch)
+                if not rows:
+                    write(buf.getvalue())
+            else:
+                for batch in batches:
+                    write(''.join(json.dumps(dict(zip(EXPORT_COLUMNS, r))) + '\n' for r in batch))
+                    rows += len(batch)
+            if gz is not None:
+                self._write_chunk(gz.flush())
+            self._end_chunked()
+        except OSError:
+            # Client went away mid-download
+            self.close_connection = True
+        except Exception as e:
+            # Headers are out, so the only way to signal failure is to cut the body short
+            self.close_connection = True
+            log_event(log, "recents_export_failed", level=logging.ERROR, rows=rows, error=str(e))
+        finally:
+            batches.close()
+
     def do_GET(self):
         parsed = urlparse(self.path)
         path = unquote(parsed.path)
 
-        # --- API: Get Recents ---
-        if path.startswith('/api/recents'):
-            recs = get_recents()
+        # --- API: Export Recents (streamed NDJSON / CSV) ---
+        if path == '/api/recents/export':
+            user = check_auth(self)
+            if not user:
+                return
+            qs = parse_qs(parsed.query)
+            fmt = qs.get('format', ['ndjson'])[0].lower()
+            if fmt not in EXPORT_FORMATS:
+                self._send_json(400, {'error': 'format must be ndjson or csv'})
+                return
+            try:
+                since = _date_bound(qs.get('from', [None])[0])
+                until = _date_bound(qs.get('to', [None])[0], end=True)
+            except ValueError:
+                self._send_json(400, {'error': 'from and to must be ISO dates, e.g. 2024-05-01'})
+                return
+            batches = iter_recents(
+                user_id_of(user),
+                company=qs.get('company', [None])[0],
+                tab=qs.get('tab', [None])[0],
+                since=since,
+                until=until,
+            )
+            use_gzip = qs.get('gzip', [None])[0] not in ('0', 'false') and accepts_gzip(self.headers)
+            self._stream_export(fmt, batches, use_gzip)
+            return
+
+        # --- API: Full-text search over Recents ---
+        if path == '/api/recents/search':
+            user = check_auth(self)
+            if not user:
+                return
+            qs = parse_qs(parsed.query)
+            text = qs.get('q', [''])[0].strip()
+            try:
+                limit = min(max(int(qs.get('limit', ['20'])[0]), 1), RECENTS_MAX_LIMIT)
+            except ValueError:
+                limit = 20
+            if not text:
+                self._send_json(400, {'error': 'q required'})
+                return
             data = [
                 {
                     'id': r[0],
                     'company': r[1],
                     'tab': r[2],
-                    'prompt': r[3],
-                    'response': r[4],
-                    'created_at': r[5]
-                } for r in recs
+                    # HTML-escaped, with the matched terms in <mark>
+                    'prompt_snippet': r[3],
+                    'response_snippet': r[4],
+                    'created_at': r[5],
+                    'score': -r[6]
+                } for r in search_recents(user_id_of(user), text, limit)
             ]
-            self._set_headers(200, 'application/json')
-            self.wfile.write(json.dumps({'recents': data}).encode('utf-8'))
+            self._send_json(200, {'query': text, 'results': data})
+            return
+
+        # --- API: Get a single Recent (full response) ---
+        if path.startswith('/api/recents/'):
+            user = check_auth(self)
+            if not user:
+                return
+            rec_id = path[len('/api/recents/'):]
+            row = get_recent(int(rec_id), user_id_of(user)) if rec_id.isdigit() else None
+            if not row:
+                self._send_json(404, {'error': 'recent not found'})
+                return
+            self._send_json(200, {'recent': _recent_to_dict(row)})
+            return
+
+        # --- API: Get Recents (keyset paginated) ---
+        if path == '/api/recents':
+            user = check_auth(self)
+            if not user:
+                return
+            qs = parse_qs(parsed.query)
+            try:
+                limit = min(max(int(qs.get('limit', ['50'])[0]), 1), RECENTS_MAX_LIMIT)
+                before_id = int(qs['before_id'][0]) if qs.get('before_id') else None
+            except ValueError:
+                self._send_json(400, {'error': 'limit and before_id must be integers'})
+                return
+            summary = qs.get('summary', ['0'])[0] in ('1', 'true')
+
+            recs = get_recents(
+                user_id_of(user),
+                limit=limit,
+                before_id=before_id,
+                company=qs.get('company', [None])[0],
+                tab=qs.get('tab', [None])[0],
+                summary=summary,
+            )
+            data = [_recent_to_dict(r, summary) for r in recs]
+            self._send_json(200, {
+                'recents': data,
+                'next_before_id': recs[-1][0] if len(recs) == limit else None,
+            })
+            return
+
+        # --- API: Company autocomplete ---
+        if path == '/api/companies/search':
+            qs = parse_qs(parsed.query)
+            try:
+                limit = min(max(int(qs.get('limit', ['10'])[0]), 1), 50)
+            except ValueError:
+                limit = 10
+            matches = company_index.search(qs.get('q', [''])[0], limit)
+            self._send_json(200, {
+                'companies': [{'id': m[0], 'name': m[1], 'ticker': m[2]} for m in matches]
+            }, {'Cache-Control': 'max-age=60'})
             return
 
         # --- API: Get Favourites ---
         if path == '/api/favourites':
-            favs = get_favourites()
+            user = check_auth(self)
+            if not user:
+                return
+            favs = get_favourites(user_id_of(user))
+            # Briefings are precomputed off-peak by briefing_scheduler
             data = [
-                {'company_id': f[0], 'company_name': f[1], 'created_at': f[2]}
+                {'company_id': f[0], 'company_name': f[1], 'created_at': f[2],
+                 'briefing': f[3], 'briefing_at': f[4],
+                 'briefing_stale': f[3] is not None and briefing_scheduler.is_stale(f[4])}
                 for f in favs
             ]
-            self._set_headers(200, 'application/json')
-            self.wfile.write(json.dumps({'favourites': data}).encode('utf-8'))
+            self._send_json(200, {'favourites': data})
             return
         
         
 
+        # --- API: Prometheus metrics ---
+        if path == '/api/metrics':
+            self._send(200, registry.render().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8')
+            return
+
+        # --- API: Cache / server stats ---
+        if path == '/api/stats':
+            self._send_json(200, {
+                'research_cache': research_cache.stats(),
+                'similar_questions': question_index.stats(),
+                'company_index': company_index.stats(),
+                'news_cache': news_cache.stats(),
+                'upstreams': upstream_stats(),
+                'single_flight': single_flight_stats(),
+                'upstream_guards': upstream_guard_stats(),
+                'recents_writer': recents_writer.stats(),
+                'recents_compactor': recents_compactor.stats(),
+                'briefings': briefing_scheduler.stats(),
+                'startup': startup.report(),
+            })
+            return
+
         # --- Serve Static Files ---
+        self._serve_static(path)
+
+    def do_HEAD(self):
+        path = unquote(urlparse(self.path).path)
+        if path.startswith('/api/'):
+            self._send_json(405, {'error': 'method not allowed'}, {'Allow': 'GET, POST'})
+            return
+        self._serve_static(path)
+
+    def _serve_static(self, path):
         if path == '/' or path == '/index.html':
             path = '/login.html'
 
-        file_path = os.path.join(STATIC_DIR, path.lstrip('/'))
-        if os.path.isfile(file_path):
-            ctype = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
-            self._set_headers(200, ctype)
-            with open(file_path, 'rb') as f:
-                self.wfile.write(f.read())
-        else:
-            self.send_error(404, f'File Not Found: {self.path}')
+        asset = static_files.get(path)
+        if asset is None:
+            # send_error() would also close the connection; a missing asset shouldn't
+            self._send(404, b'File Not Found', 'text/plain; charset=utf-8')
+            return
+
+        use_gzip = asset.gzip_body is not None and accepts_gzip(self.headers)
+        etag = asset.gzip_etag if use_gzip else asset.etag
+
+        if asset.not_modified(self.headers):
+            # 304 has no body and so no Content-Length
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', asset.cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        headers = {
+            'ETag': etag,
+            'Last-Modified': asset.last_modified,
+            'Cache-Control': asset.cache_control,
+        }
+        if asset.gzip_body is not None:
+            headers['Vary'] = 'Accept-Encoding'
+        if use_gzip:
+            headers['Content-Encoding'] = 'gzip'
+        self._send(200, asset.gzip_body if use_gzip else asset.body, asset.content_type, headers)
 
 
 
@@ -80,18 +530,46 @@ class SimpleHandler(BaseHTTPRequestHandler):
         parsed = urlparse(self.path)
         path = unquote(parsed.path)
 
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            self.close_connection = True
+            self._send_json(411, {'error': 'Content-Length required'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY_BYTES:
+            # Unread, so the connection cannot be reused
+            self.close_connection = True
+            self._send_json(413 if length > 0 else 400, {'error': 'invalid or oversized request body'})
+            return
+        self._read_body()
+
+        if path in UPSTREAM_ROUTES and hasattr(self.server, 'try_acquire_upstream_slot'):
+            if not self.server.try_acquire_upstream_slot():
+                self._send_json(503, {'error': 'server busy, please retry'}, {'Retry-After': '1'})
+                return
+            self._holding_upstream = True
+            try:
+                self._handle_post(path)
+            finally:
+                self._holding_upstream = False
+                self.server.release_upstream_slot()
+            return
+
+        self._handle_post(path)
+
+    def _handle_post(self, path):
         # --- AUTH: Signup ---
         if path == '/api/auth/signup':
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length)
+            body = self._read_body()
             data = json.loads(body)
             
             email = data.get('email')
             password = data.get('password')
             
             if not email or not password:
-                self._set_headers(400)
-                self.wfile.write(json.dumps({'error': 'email and password required'}).encode())
+                self._send_json(400, {'error': 'email and password required'})
                 return
             
             result = signup_user(email, password)
@@ -99,8 +577,7 @@ class SimpleHandler(BaseHTTPRequestHandler):
             if result['success']:
                 # Check if session exists (auto-confirm) or requires email verification
                 if result['session']:
-                    self._set_headers(200)
-                    self.wfile.write(json.dumps({
+                    self._send_json(200, {
                         'message': 'Signup successful.',
                         'session': {
                             'access_token': result['session'].access_token,
@@ -109,42 +586,37 @@ class SimpleHandler(BaseHTTPRequestHandler):
                                 'email': result['user'].email
                             }
                         }
-                    }).encode())
+                    })
                 else:
                     # Email confirmation required
-                    self._set_headers(200)
-                    self.wfile.write(json.dumps({
+                    self._send_json(200, {
                         'message': 'Signup successful. Please check your email to verify your account.',
                         'requires_verification': True,
                         'user': {
                             'id': result['user'].id,
                             'email': result['user'].email
                         }
-                    }).encode())
+                    })
             else:
-                self._set_headers(400)
-                self.wfile.write(json.dumps({'error': result['error']}).encode())
+                self._send_json(400, {'error': result['error']})
             return
 
         # --- AUTH: Login ---
         if path == '/api/auth/login':
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length)
+            body = self._read_body()
             data = json.loads(body)
             
             email = data.get('email')
             password = data.get('password')
             
             if not email or not password:
-                self._set_headers(400)
-                self.wfile.write(json.dumps({'error': 'email and password required'}).encode())
+                self._send_json(400, {'error': 'email and password required'})
                 return
             
             result = login_user(email, password)
             
             if result['success']:
-                self._set_headers(200)
-                self.wfile.write(json.dumps({
+                self._send_json(200, {
                     'message': 'Login successful',
                     'session': {
                         'access_token': result['session'].access_token,
@@ -153,10 +625,9 @@ class SimpleHandler(BaseHTTPRequestHandler):
                             'email': result['user'].email
                         }
                     }
-                }).encode())
+                })
             else:
-                self._set_headers(401)
-                self.wfile.write(json.dumps({'error': result['error']}).encode())
+                self._send_json(401, {'error': result['error']})
             return
 
         # --- AUTH: Logout ---
@@ -166,8 +637,7 @@ class SimpleHandler(BaseHTTPRequestHandler):
                 token = auth_header.replace('Bearer ', '')
                 logout_user(token)
             
-            self._set_headers(200)
-            self.wfile.write(json.dumps({'message': 'Logged out'}).encode())
+            self._send_json(200, {'message': 'Logged out'})
             return
             
         # --- API: Research Query ---
@@ -177,8 +647,7 @@ class SimpleHandler(BaseHTTPRequestHandler):
             if not user:
                 return
             
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length)
+            body = self._read_body()
             try:
                 data = json.loads(body)
                 company = data.get('company', '').strip()
@@ -186,70 +655,165 @@ class SimpleHandler(BaseHTTPRequestHandler):
                 question = data.get('question', '').strip()
 
                 if not company or not question:
-                    self._set_headers(400)
-                    self.wfile.write(json.dumps({'error': 'company and question required'}).encode('utf-8'))
+                    self._send_json(400, {'error': 'company and question required'})
                     return
 
-                prompt = f"You are a financial assistant. Provide concise, factual information about {company} focusing on {tab}. Question: {question}"
+                # --- Answer cache, then Groq (or the last saved answer if it is unavailable) ---
+                answer, ok, cached, answered_at = answer_question(company, tab, question, user_id_of(user))
 
-                # --- Call Groq API ---
-                if GROQ_KEY:
-                    try:
-                        headers = {
-                            "Authorization": f"Bearer {GROQ_KEY}",
-                            "Content-Type": "application/json",
-                        }
+                if not ok and answered_at:
+                    self._send_json(200, {'answer': answer, 'cached': False, 'stale': True,
+                                                 'answered_at': answered_at})
+                    return
+                if not ok:
+                    self._send_json(503, {'error': answer})
+                    return
 
-                        payload = {
-                            "model": GROQ_MODEL,
-                            "messages": [
-                                {"role": "system", "content": "You are a financial assistant for Stock In."},
-                                {"role": "user", "content": prompt}
-                            ],
-                            "max_tokens": 800,
-                            "temperature": 0.3
-                        }
+                # Save to recents; a reused answer keeps its original time, so it still expires
+                persist_recent(company, tab, question, answer, user_id_of(user), created_at=answered_at)
+                self._send_json(200, {'answer': answer, 'cached': cached})
+
+            except Exception as e:
+                self._send_json(500, {'error': str(e)})
+            return
+
+        
+        # --- API: Research Query (Server-Sent Events) ---
+        if path == '/api/research/stream':
+            user = check_auth(self)
+            if not user:
+                return
+
+            data = json.loads(self._read_body() or b'{}')
+            company = data.get('company', '').strip()
+            tab = data.get('tab', '').strip()
+            question = data.get('question', '').strip()
+
+            if not company or not question:
+                self._send_json(400, {'error': 'company and question required'})
+                return
+
+            self._start_chunked()
+            client_open = True
 
-                        r = requests.post(
-                            "https://api.groq.com/openai/v1/chat/completions",
-                            headers=headers,
-                            json=payload,
-                            timeout=40
-                        )
-
-                        print("Groq status:", r.status_code)
-                        print("Groq response:", r.text[:400])  # debug log
-
-                        if r.status_code == 200:
-                            j = r.json()
-                            answer = (
-                                j.get("choices", [{}])[0]
-                                .get("message", {})
-                                .get("content", "[No content returned]")
-                            )
-                        else:
-                            answer = f"[Groq API error {r.status_code}] {r.text}"
-
-                    except Exception as e:
-                        answer = f"[Groq API call failed: {str(e)}]"
+            def send(payload, event=None):
+                nonlocal client_open
+                if not client_open:
+                    return
+                try:
+                    self._write_sse(payload, event)
+                except OSError:
+                    # Gone or timed out; keep reading from Groq so the answer is still saved
+                    client_open = False
+
+            answered_at = None
+            found = cached_answer(company, tab, question, user_id_of(user))
+            if found is not None:
+                answer, answered_at = found
+                send({'token': answer})
+                send({'cached': True}, event='done')
+            else:
+                # A question already in flight is answered once and sent to the others whole
+                answer, ok, partial = stream_answer(company, tab, question, lambda token: send({'token': token}))
+                if ok:
+                    send({'cached': False}, event='done')
                 else:
-                    answer = "[No GROQ_API_KEY set in .env]"
+                    # Neither error text nor a cut-off answer is saved
+                    error, answer = answer, None
+                    saved = None if partial else latest_answer(user_id_of(user), company, tab)
+                    if saved is not None:
+                        send({'token': saved[0]})
+                        send({'cached': False, 'stale': True, 'answered_at': saved[1]}, event='done')
+                    else:
+                        send({'error': error}, event='error')
+
+            # Save to recents
+            if answer is not None:
+                persist_recent(company, tab, question, answer, user_id_of(user), created_at=answered_at)
+            if client_open:
+                try:
+                    self._end_chunked()
+                except OSError:
+                    pass
+            return
 
-                # Save to recents
-                save_recent(company, tab, question, answer)
-                self._set_headers(200, 'application/json')
-                self.wfile.write(json.dumps({'answer': answer}).encode('utf-8'))
+        # --- API: Batch Research (concurrent fan-out) ---
+        if path == '/api/research/batch':
+            user = check_auth(self)
+            if not user:
+                return
 
-            except Exception as e:
-                self._set_headers(500)
-                self.wfile.write(json.dumps({'error': str(e)}).encode('utf-8'))
+            data = json.loads(self._read_body() or b'{}')
+            items = data.get('items')
+            if not isinstance(items, list) or not items:
+                self._send_json(400, {'error': 'items required'})
+                return
+            if len(items) > RESEARCH_BATCH_MAX:
+                self._send_json(400, {'error': f'at most {RESEARCH_BATCH_MAX} items per batch'})
+                return
+
+            cleaned = [clean_item(item) for item in items]
+            valid = [i for i, item in enumerate(cleaned) if item]
+            results = [
+                None if item else {'index': i, 'error': 'company and question required'}
+                for i, item in enumerate(cleaned)
+            ]
+            stream = bool(data.get('stream')) or parse_qs(urlparse(self.path).query).get('stream', ['0'])[0] in ('1', 'true')
+            client_open = True
+
+            def emit(result):
+                nonlocal client_open
+                if not client_open:
+                    return
+                try:
+                    self._write_chunk((json.dumps(result) + '\n').encode('utf-8'))
+                except OSError:
+                    # Gone or timed out; keep going so the finished answers are still saved
+                    client_open = False
+
+            if stream:
+                # NDJSON, one line per item in completion order
+                self._start_chunked(content_type='application/x-ndjson')
+                for r in results:
+                    if r:
+                        emit(r)
+
+            fresh = []
+            for n, answer, ok, cached, answered_at in answer_batch([cleaned[i] for i in valid], user_id_of(user)):
+                i = valid[n]
+                company, tab, question = cleaned[i]
+                result = {'index': i, 'company': company, 'tab': tab, 'question': question}
+                if ok:
+                    result.update(answer=answer, cached=cached)
+                    fresh.append((company, tab, question, answer, answered_at, user_id_of(user)))
+                elif answered_at:
+                    result.update(answer=answer, cached=False, stale=True, answered_at=answered_at)
+                else:
+                    result['error'] = answer
+                results[i] = result
+                if stream:
+                    emit(result)
+
+            # Save every fresh answer to recents in one transaction
+            if fresh:
+                save_recents(fresh)
+
+            if stream:
+                if client_open:
+                    try:
+                        self._end_chunked()
+                    except OSError:
+                        pass
+            else:
+                self._send_json(200, {'results': results})
             return
 
-        
         # add to favourites
         if path == '/api/favourites':
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length)
+            user = check_auth(self)
+            if not user:
+                return
+            body = self._read_body()
             data = json.loads(body)
 
             company_id = data.get('company_id')
@@ -257,95 +821,138 @@ class SimpleHandler(BaseHTTPRequestHandler):
             is_fav = data.get('isFavourite', True)
 
             if company_name is None or company_name.strip() == '':
-                self._set_headers(400)
-                self.wfile.write(json.dumps({'error': 'company_id and company_name required'}).encode('utf-8'))
+                self._send_json(400, {'error': 'company_id and company_name required'})
                 return
 
             if is_fav:
-                add_favourite(company_id, company_name)
+                add_favourite(user_id_of(user), company_id, company_name.strip())
             else:
-                remove_favourite(company_id)
+                remove_favourite(user_id_of(user), company_name.strip())
 
-            self._set_headers(200)
-            self.wfile.write(json.dumps({'status': 'ok'}).encode('utf-8'))
+            self._send_json(200, {'status': 'ok'})
             return
         
         # --- API: Remove Recent ---
         if path == '/api/remove_recent':
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length)
+            user = check_auth(self)
+            if not user:
+                return
+            body = self._read_body()
             data = json.loads(body)
             rec_id = data.get('id')
 
             if not rec_id:
-                self._set_headers(400)
-                self.wfile.write(json.dumps({'error': 'id required'}).encode('utf-8'))
+                self._send_json(400, {'error': 'id required'})
                 return
 
-            # Import or define remove_recent in models.py
-            from models import remove_recent
-            remove_recent(rec_id)
+            remove_recent(rec_id, user_id_of(user))
 
-            self._set_headers(200)
-            self.wfile.write(json.dumps({'status': 'deleted'}).encode('utf-8'))
+            self._send_json(200, {'status': 'deleted'})
             return
         
         if path == '/api/news_for_company':
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length)
+            body = self._read_body()
             data = json.loads(body)
             company_name = data.get('company_name')
             if not company_name:
-                self._set_headers(400)
-                self.wfile.write(json.dumps({'error': 'company_name required'}).encode())
+                self._send_json(400, {'error': 'company_name required'})
                 return
 
-            API_KEY = os.getenv("NEWSAPI_KEY")
-            url = f"https://newsapi.org/v2/everything?q={requests.utils.quote(company_name)}&sortBy=publishedAt&language=en&apiKey={API_KEY}"
-            try:
-                r = requests.get(url, timeout=20)
-                if r.status_code == 200:
-                    resp = r.json()
-                    articles = [
-                        {
-                            "title": a.get("title"),
-                            "url": a.get("url"),
-                            "source": a.get("source", {}).get("name"),
-                            "publishedAt": a.get("publishedAt")
-                        }
-                        for a in resp.get("articles", [])[:5]
-                    ]
-                else:
-                    articles = []
-            except Exception as e:
-                articles = []
-                print("News API error:", str(e))
+            articles = news_cache.get(company_name)
 
-            self._set_headers(200)
-            self.wfile.write(json.dumps({'company': company_name, 'articles': articles}).encode())
+            self._send_json(200, {'company': company_name, 'articles': articles})
             return
 
 
 
 
+        # --- API: News for many companies at once ---
+        if path == '/api/news_for_companies':
+            data = json.loads(self._read_body() or b'{}')
+            names = [n.strip() for n in data.get('company_names') or [] if isinstance(n, str) and n.strip()]
+            if not names:
+                self._send_json(400, {'error': 'company_names required'})
+                return
+            if len(names) > NEWS_BATCH_MAX:
+                self._send_json(400, {'error': f'at most {NEWS_BATCH_MAX} companies per request'})
+                return
+
+            results = news_cache.get_many(names)
+            self._send_json(200, {
+                'results': [{'company': n, 'articles': a} for n, a in zip(names, results)]
+            })
+            return
+
         # --- Unknown Endpoint ---
-        self._set_headers(404)
-        self.wfile.write(json.dumps({'error': 'unknown endpoint'}).encode('utf-8'))
+        self._send_json(404, {'error': 'unknown endpoint'})
 
             
     
 
 
-def run(server_class=HTTPServer, handler_class=SimpleHandler, port=8000):
+def _serve_worker(httpd, slot, on_ready=None):
+    # Only one process runs the background jobs; the others would repeat its work
+    if slot == 0:
+        start_news_refresher(get_favourite_companies)
+        recents_compactor.start()
+        briefing_scheduler.start()
+    if RECENTS_WRITE_BEHIND:
+        recents_writer.start()
+
+    def ready():
+        startup.ready(slot=slot, pid=os.getpid())
+        if on_ready is not None:
+            on_ready()
+
+    serve(httpd, ready)
+    # Requests are drained; flush anything still queued for recents
+    recents_writer.stop()
+    recents_compactor.stop()
+    briefing_scheduler.stop()
+
+
+def run(server_class=PooledHTTPServer, handler_class=SimpleHandler, port=8000,
+        workers=SERVER_WORKERS, upstream_workers=UPSTREAM_WORKERS, processes=SERVER_PROCESSES):
     server_address = ('', port)
-    httpd = server_class(server_address, handler_class)
-    print(f"Serving on http://localhost:{port} ...")
-    try:
-        httpd.serve_forever()
-    except KeyboardInterrupt:
-        print("Shutting down server")
-        httpd.server_close()
+    listen_fd, inherited = inherited_listener()
+    httpd = server_class(server_address, handler_class, workers=workers, upstream_workers=upstream_workers,
+                         bind_and_activate=listen_fd is None)
+    if listen_fd is not None:
+        # Re-exec'd by a deploying supervisor: keep the socket its workers are still accepting on
+        httpd.socket.close()
+        httpd.socket = socket.socket(fileno=listen_fd)
+        httpd.server_address = httpd.socket.getsockname()
+    print(f"Loaded {static_files.preload()} static files into memory")
+    startup.mark('static_preload')
+    if processes <= 1:
+        print(f"Serving on http://localhost:{port} with {httpd.workers} workers "
+              f"({httpd.upstream_workers} for upstream calls) ...")
+        _serve_worker(httpd, 0)
+        return
+
+    # Pre-fork: init_db() has run once, here, at import. Workers inherit the
+    # bound socket and the preloaded static files, and open their own SQLite
+    # connections. A non-blocking socket lets the workers that lose the race
+    # for a connection go back to waiting instead of blocking in accept().
+    httpd.socket.setblocking(False)
+    close_conn()
+    print(f"Serving on http://localhost:{port} with {processes} processes x {httpd.workers} workers "
+          f"({httpd.upstream_workers} for upstream calls each) ...")
+    startup.ready(processes=processes, reexec=listen_fd is not None)
+    Supervisor(processes, lambda slot, ready: _serve_worker(httpd, slot, ready),
+               listen_fd=httpd.socket.fileno(), exec_argv=[sys.executable] + sys.argv,
+               exec_env=startup.initial_environ, inherited=inherited).run()
+    httpd.server_close()
 
 
 if __name__ == '__main__':
-    run()
+    parser = argparse.ArgumentParser(description="Stock In server")
+    parser.add_argument('--port', type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument('--workers', type=int, default=SERVER_PROCESSES,
+                        help="worker processes sharing the listening socket (SIGHUP redeploys them one by one)")
+    parser.add_argument('--check', action='store_true',
+                        help="load the code, config and schema, then exit (run before a SIGHUP redeploy)")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0)
+    run(port=args.port, processes=args.workers)
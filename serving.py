@@ -0,0 +1,131 @@
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+
+# Worker threads that handle connections, and how many of those may be tied
+# up at once waiting on slow upstreams (Groq, NewsAPI, Supabase). The rest are
+# always free for static files and local API routes such as /api/recents.
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "16"))
+UPSTREAM_WORKERS = int(os.getenv("UPSTREAM_WORKERS", str(max(1, SERVER_WORKERS // 2))))
+
+# HTTP/1.1 keep-alive: how long an idle connection may wait for its next
+# request, and how many requests one connection may carry before it is closed
+KEEPALIVE_TIMEOUT = float(os.getenv("KEEPALIVE_TIMEOUT", "5"))
+KEEPALIVE_MAX_REQUESTS = int(os.getenv("KEEPALIVE_MAX_REQUESTS", "100"))
+# Socket timeout while reading a request body or writing a response
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "60"))
+MAX_BODY_BYTES = int(os.getenv("MAX_BODY_BYTES", str(1024 * 1024)))
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that hands each connection to a bounded thread pool."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, workers=SERVER_WORKERS,
+                 upstream_workers=UPSTREAM_WORKERS, bind_and_activate=True):
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self.workers = max(1, workers)
+        # Always keep at least one worker out of reach of upstream-bound routes
+        self.upstream_workers = max(1, min(upstream_workers, self.workers - 1))
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="http-worker")
+        self._upstream_slots = threading.BoundedSemaphore(self.upstream_workers)
+        self._inflight = 0
+        self._upstream_busy = 0
+        self._inflight_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._inflight_lock:
+            self._inflight += 1
+        try:
+            self._pool.submit(self._process_request_worker, request, client_address)
+        except RuntimeError:
+            # Pool already shut down; drop the connection
+            with self._inflight_lock:
+                self._inflight -= 1
+            self.shutdown_request(request)
+
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._inflight_lock:
+                self._inflight -= 1
+
+    def try_acquire_upstream_slot(self):
+        """Reserve an upstream slot without blocking; False when all are busy."""
+        if not self._upstream_slots.acquire(blocking=False):
+            return False
+        with self._inflight_lock:
+            self._upstream_busy += 1
+        return True
+
+    def release_upstream_slot(self):
+        with self._inflight_lock:
+            self._upstream_busy -= 1
+        self._upstream_slots.release()
+
+    def has_spare_workers(self, holding_upstream=False):
+        """
+        True while keeping this connection open still leaves a worker free for
+        non-upstream routes. An idle keep-alive connection holds its worker, so
+        connections outside upstream calls (this one included, once its slot
+        is released) must stay below workers - upstream_workers: every upstream
+        slot may fill up and the reserved worker must not be parked on.
+        """
+        with self._inflight_lock:
+            parked = self._inflight - self._upstream_busy + (1 if holding_upstream else 0)
+        return parked < self.workers - self.upstream_workers
+
+    def inflight(self):
+        with self._inflight_lock:
+            return self._inflight
+
+    def drain(self):
+        """Wait for every accepted request to finish, then stop the pool."""
+        self._pool.shutdown(wait=True)
+
+
+def serve(httpd, on_ready=None):
+    """
+    Run httpd until SIGINT/SIGTERM, then drain in-flight requests and close.
+    on_ready() is called once the accept loop is running.
+    """
+    stop = threading.Event()
+
+    def _request_stop(signum, frame):
+        stop.set()
+
+    previous = {}
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            previous[sig] = signal.signal(sig, _request_stop)
+        except ValueError:
+            # Not on the main thread; rely on the caller to stop us
+            pass
+
+    loop = threading.Thread(target=httpd.serve_forever, name="http-accept", daemon=True)
+    loop.start()
+    if on_ready is not None:
+        on_ready()
+    try:
+        while not stop.wait(0.5):
+            pass
+    finally:
+        print("Shutting down server")
+        httpd.shutdown()
+        loop.join()
+        if isinstance(httpd, PooledHTTPServer):
+            pending = httpd.inflight()
+            if pending:
+                print(f"Draining {pending} in-flight request(s) ...")
+            httpd.drain()
+        httpd.server_close()
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
@@ -0,0 +1,49 @@
+import os
+import time
+
+from logs import get_logger, log_event
+
+log = get_logger("startup")
+
+# Imported first by server.py, so this is as close to process start as we can see
+_last = time.perf_counter()
+# The environment as given, before any load_dotenv(): a supervisor re-exec'd to
+# deploy starts from this, so values edited in .env are read again
+initial_environ = dict(os.environ)
+_phases = []  # (name, seconds)
+_reported = False
+_forked = False
+
+
+def mark(phase):
+    """Record the time since the previous mark (or start-up) as phase."""
+    global _last
+    now = time.perf_counter()
+    _phases.append((phase, round(now - _last, 4)))
+    _last = now
+
+
+def ready(**fields):
+    """Mark the final phase and log the whole start-up breakdown, once per process."""
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    mark('worker_ready' if _forked else 'ready')
+    log_event(log, "startup", **report(), **fields)
+
+
+def report():
+    return {'phases': dict(_phases), 'total_seconds': round(sum(s for _, s in _phases), 4)}
+
+
+def _after_fork():
+    # A pre-fork worker keeps the supervisor's phases and adds its own, timed
+    # from the fork rather than from when the supervisor booted
+    global _last, _reported, _forked
+    _last = time.perf_counter()
+    _reported = False
+    _forked = True
+
+
+os.register_at_fork(after_in_child=_after_fork)
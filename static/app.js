@@ -5,6 +5,28 @@ document.addEventListener('DOMContentLoaded', () => {
     const questionInput = document.getElementById('question');
     const tabSelect = document.getElementById('tab');
 
+    // Company autocomplete; only the newest keystroke's answer is shown
+    const companyOptions = document.getElementById('companyOptions');
+    let companyQuery = 0;
+    companyInput.addEventListener('input', async () => {
+        const q = companyInput.value.trim();
+        const mine = ++companyQuery;
+        if (!q) return companyOptions.replaceChildren();
+        try {
+            const res = await fetch(`/api/companies/search?q=${encodeURIComponent(q)}`);
+            const data = await res.json();
+            if (mine !== companyQuery) return;
+            companyOptions.replaceChildren(...data.companies.map(c => {
+                const opt = document.createElement('option');
+                opt.value = c.name;
+                if (c.ticker) opt.label = c.ticker;
+                return opt;
+            }));
+        } catch (err) {
+            // Autocomplete is a convenience; typing still works without it
+        }
+    });
+
     function addMessage(text, type) {
         const div = document.createElement('div');
         div.className = `msg ${type}`;
@@ -30,21 +52,70 @@ document.addEventListener('DOMContentLoaded', () => {
         chatBox.scrollTop = chatBox.scrollHeight;
 
         try {
-            // Use authFetch instead of regular fetch
-            const res = await authFetch('/api/research', {
+            // Stream tokens over Server-Sent Events; authFetch returns null and redirects on 401
+            const res = await authFetch('/api/research/stream', {
                 method: 'POST',
                 body: JSON.stringify({ company, tab, question })
             });
-            
-            // authFetch returns null and redirects on 401
+
             if (!res) {
                 chatBox.removeChild(typing);
                 return;
             }
-            
-            const data = await res.json();
-            chatBox.removeChild(typing);
-            addMessage(data.answer || "No response received.", 'bot');
+
+            if (!res.ok || !res.body) {
+                const data = await res.json();
+                chatBox.removeChild(typing);
+                addMessage(data.answer || data.error || "No response received.", 'bot');
+                return;
+            }
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let answer = '';
+            let staleAt = null;
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // SSE events are separated by a blank line
+                let sep;
+                while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                    const block = buffer.slice(0, sep);
+                    buffer = buffer.slice(sep + 2);
+
+                    let event = 'message';
+                    let payload = '';
+                    block.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) event = line.slice(6).trim();
+                        else if (line.startsWith('data:')) payload += line.slice(5).trim();
+                    });
+                    if (!payload) continue;
+                    const data = JSON.parse(payload);
+
+                    if (event === 'error') {
+                        answer = answer || data.error;
+                    } else if (event === 'done' && data.stale) {
+                        staleAt = data.answered_at;
+                    } else if (data.token) {
+                        answer += data.token;
+                    }
+                    typing.textContent = answer;
+                    chatBox.scrollTop = chatBox.scrollHeight;
+                }
+            }
+
+            if (!answer) typing.textContent = "No response received.";
+            if (staleAt) {
+                // Live research was unavailable; this is the last saved answer for the company/tab
+                const note = document.createElement('div');
+                note.className = 'stale-note';
+                note.textContent = `Live research is busy right now. Showing a saved answer from ${new Date(staleAt + 'Z').toLocaleString()}.`;
+                typing.appendChild(note);
+            }
         } catch (err) {
             chatBox.removeChild(typing);
             addMessage("Error fetching response.", 'bot');
@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "300"))
+STATIC_RECHECK_SECONDS = float(os.getenv("STATIC_RECHECK_SECONDS", "1"))
+STATIC_MAX_CACHED_BYTES = int(os.getenv("STATIC_MAX_CACHED_BYTES", str(2 * 1024 * 1024)))
+
+# Only these file types are ever served; everything else (.py, .db, .env ...) is a 404
+STATIC_EXTENSIONS = {
+    '.html', '.css', '.js', '.json', '.svg', '.png', '.jpg', '.jpeg',
+    '.gif', '.ico', '.webp', '.woff', '.woff2', '.map',
+}
+COMPRESSIBLE_EXTENSIONS = {'.html', '.css', '.js', '.json', '.svg', '.map'}
+# The root is the project directory, so only the frontend is served from it:
+# these pages at the top level, and anything under the asset directories.
+# Everything else there (requirements.txt, bench/results/*.json, tests/) is a 404.
+FRONTEND_PAGES = frozenset({
+    'index.html', 'login.html', 'signup.html', 'research.html', 'recents.html', 'favourites.html',
+})
+ASSET_DIRS = frozenset({'static'})
+
+
+class Asset:
+    __slots__ = ('path', 'body', 'gzip_body', 'etag', 'gzip_etag', 'last_modified',
+                 'mtime', 'size', 'content_type', 'cache_control', 'checked_at')
+
+    def __init__(self, path, body, mtime, size, compress=True):
+        ext = os.path.splitext(path)[1].lower()
+        self.path = path
+        self.body = body
+        self.mtime = mtime
+        self.size = size
+        self.checked_at = time.monotonic()
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or ext in ('.js', '.json', '.svg'):
+            if 'charset' not in self.content_type:
+                self.content_type += '; charset=utf-8'
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        self.etag = f'"{digest}"'
+        self.last_modified = formatdate(mtime, usegmt=True)
+        # HTML is revalidated on every navigation so deploys show up immediately
+        self.cache_control = 'no-cache' if ext == '.html' else f'public, max-age={STATIC_MAX_AGE}'
+
+        self.gzip_body = None
+        self.gzip_etag = None
+        if compress and ext in COMPRESSIBLE_EXTENSIONS and len(body) > 256:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.gzip_body = compressed
+                self.gzip_etag = f'"{digest}-gz"'
+
+    def not_modified(self, headers):
+        """True if the request's validators show the client already has this version."""
+        inm = headers.get('If-None-Match')
+        if inm is not None:
+            tags = {t.strip() for t in inm.split(',')}
+            return '*' in tags or self.etag in tags or (self.gzip_etag is not None and self.gzip_etag in tags)
+        ims = headers.get('If-Modified-Since')
+        if ims:
+            try:
+                return int(self.mtime) <= parsedate_to_datetime(ims).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+class StaticFiles:
+    """In-memory static asset cache rooted at one directory, invalidated by mtime."""
+
+    def __init__(self, root, pages=FRONTEND_PAGES, asset_dirs=ASSET_DIRS):
+        self.root = os.path.realpath(root)
+        self.pages = frozenset(pages)
+        self.asset_dirs = frozenset(asset_dirs)
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, url_path):
+        """Map a decoded URL path to a file under root, or None if it is not servable."""
+        rel = url_path.lstrip('/')
+        parts = rel.replace('\\', '/').split('/')
+        if not rel or any(p.startswith('.') for p in parts if p):
+            return None
+        full = os.path.realpath(os.path.join(self.root, rel))
+        if os.path.commonpath([self.root, full]) != self.root:
+            return None
+        # Checked on the resolved path, so a symlink out of the allowlist is caught too
+        served = os.path.relpath(full, self.root).split(os.sep)
+        if served[0] not in (self.pages if len(served) == 1 else self.asset_dirs):
+            return None
+        if os.path.splitext(full)[1].lower() not in STATIC_EXTENSIONS:
+            return None
+        return full
+
+    def get(self, url_path):
+        full = self.resolve(url_path)
+        if full is None:
+            return None
+
+        asset = self._assets.get(full)
+        now = time.monotonic()
+        if asset is not None and now - asset.checked_at < STATIC_RECHECK_SECONDS:
+            return asset
+
+        try:
+            st = os.stat(full)
+        except OSError:
+            with self._lock:
+                self._assets.pop(full, None)
+            return None
+        if not os.path.isfile(full):
+            return None
+
+        if asset is not None and asset.mtime == st.st_mtime and asset.size == st.st_size:
+            asset.checked_at = now
+            return asset
+
+        with open(full, 'rb') as f:
+            body = f.read()
+        cacheable = st.st_size <= STATIC_MAX_CACHED_BYTES
+        asset = Asset(full, body, st.st_mtime, st.st_size, compress=cacheable)
+        if cacheable:
+            with self._lock:
+                self._assets[full] = asset
+        return asset
+
+    def preload(self):
+        """Load every servable page and asset into memory."""
+        count = sum(self.get('/' + page) is not None for page in self.pages)
+        for asset_dir in self.asset_dirs:
+            for dirpath, dirnames, filenames in os.walk(os.path.join(self.root, asset_dir)):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.') and d != '__pycache__']
+                for name in filenames:
+                    rel = os.path.relpath(os.path.join(dirpath, name), self.root)
+                    if self.get('/' + rel.replace(os.sep, '/')) is not None:
+                        count += 1
+        return count
+
+
+def accepts_gzip(headers):
+    for part in (headers.get('Accept-Encoding') or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
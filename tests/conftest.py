@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway database before db.py reads the path, so tests
+# never touch the committed stock_in.db
+os.environ.setdefault("STOCKIN_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="stockin-tests-"), "test.db"))
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def empty_recents(monkeypatch):
+    """
+    An empty recents table, a memory-only answer cache and a fresh similar
+    question index matching at 0.5 within an hour. The index is the shared
+    singleton (the save hook is bound to it), so it is reset again afterwards.
+    """
+    import research
+    from db import execute
+    from models import init_db
+    from question_index import question_index
+    from research_cache import ResearchCache
+
+    init_db()
+    execute('DELETE FROM recents')
+    monkeypatch.setattr(research, "research_cache", ResearchCache(disk_path=""))
+    monkeypatch.setattr(question_index, "threshold", 0.5)
+    monkeypatch.setattr(question_index, "max_age", 3600)
+    question_index.reset()
+    yield question_index
+    question_index.reset()
@@ -0,0 +1,39 @@
+import time
+
+import jwt
+import pytest
+
+import auth_handler
+
+SECRET = "stockin-test-secret-at-least-32-bytes"
+
+
+@pytest.fixture(autouse=True)
+def local_hs256(monkeypatch):
+    monkeypatch.setattr(auth_handler, "AUTH_VERIFY_MODE", "local")
+    monkeypatch.setattr(auth_handler, "SUPABASE_JWT_SECRET", SECRET)
+    monkeypatch.setattr(auth_handler, "verified_tokens", auth_handler.VerifiedTokens())
+
+
+def _token(secret=SECRET, **claims):
+    claims = {"sub": "user-1", "email": "a@example.com", "aud": "authenticated",
+              "exp": int(time.time()) + 300, **claims}
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+
+def test_verify_token_accepts_hs256():
+    result = auth_handler.verify_token(_token())
+    assert result["success"]
+    assert auth_handler.user_id_of(result["user"]) == "user-1"
+    # Second call is answered from the verified-token cache
+    assert auth_handler.verify_token(_token())["success"]
+
+
+def test_verify_token_rejects_bad_signature():
+    result = auth_handler.verify_token(_token(secret="another-secret-that-is-32-bytes-long"))
+    assert not result["success"]
+
+
+def test_verify_token_rejects_expired():
+    result = auth_handler.verify_token(_token(exp=int(time.time()) - 10))
+    assert not result["success"]
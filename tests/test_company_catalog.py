@@ -0,0 +1,27 @@
+from company_catalog import CompanyIndex, import_rows
+from db import query_one
+from models import init_db
+
+
+def test_full_ticker_with_punctuation_is_found():
+    init_db()
+    import_rows([("Berkshire Hathaway Inc. Class B", "BRK.B"), ("Ford Motor Company", "F")])
+    index = CompanyIndex()
+    assert [r[2] for r in index.search("BRK.B")] == ["BRK.B"]
+    assert [r[2] for r in index.search("brk b")] == ["BRK.B"]
+    assert index.search("F")[0][2] == "F"
+    # New catalog rows get a company_id for favourites
+    assert query_one("SELECT COUNT(*) FROM company WHERE company_id IS NULL")[0] == 0
+
+
+def test_refresh_without_writes_does_not_reread_or_rebuild():
+    init_db()
+    import_rows([(f"Bulk Company {i}", f"BK{i}") for i in range(3000)], batch=3000)
+    index = CompanyIndex()
+    assert index.refresh() >= 3000
+    rebuilds = index.stats()['rebuilds']
+    assert index.refresh() == 0
+    assert index.stats()['rebuilds'] == rebuilds
+    import_rows([("Bulk Company 7", "BKX")])
+    assert index.refresh() == 1
+    assert [r[2] for r in index.search("BKX")] == ["BKX"]
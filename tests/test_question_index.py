@@ -0,0 +1,37 @@
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import question_index as question_index_module
+import research
+from db import execute
+from models import save_recent
+
+
+def test_index_picks_up_rows_saved_by_another_process(empty_recents, monkeypatch):
+    monkeypatch.setattr(empty_recents, "refresh_every", 0)
+    assert research.cached_answer("Tesla", "Financials", "Tesla revenue growth", "alice") is None
+    # Another worker's insert never reaches this process's save hook
+    execute('''
+        INSERT INTO recents (company, tab, prompt, response, created_at, user_id)
+        VALUES ('Tesla', 'Financials', 'What is Tesla revenue growth?', 'From worker 2',
+                strftime('%Y-%m-%dT%H:%M:%f', 'now'), 'alice')
+    ''')
+    assert research.cached_answer("Tesla", "Financials", "Tesla revenue growth", "alice")[0] == "From worker 2"
+
+
+@pytest.mark.usefixtures("empty_recents")
+def test_reused_answer_still_expires(monkeypatch):
+    first = datetime.utcfromtimestamp(time.time() - 3000).isoformat()
+    save_recent("Tesla", "Financials", "What is Tesla revenue growth?", "Old answer", "alice", created_at=first)
+    answer, answered_at = research.cached_answer("Tesla", "Financials", "Tesla revenue growth", "alice")
+    assert (answer, answered_at) == ("Old answer", first)
+    # The server saves the reused answer again, keeping when it was first given
+    save_recent("Tesla", "Financials", "Tesla revenue growth", answer, "alice", created_at=answered_at)
+    # Past max_age (an hour) from the first answer, neither row may be served
+    later = time.time() + 1200
+    monkeypatch.setattr(question_index_module, "time", SimpleNamespace(
+        time=lambda: later, monotonic=time.monotonic, perf_counter=time.perf_counter))
+    assert research.cached_answer("Tesla", "Financials", "Tesla revenue growth", "alice") is None
@@ -0,0 +1,30 @@
+import threading
+
+from research_cache import ResearchCache
+
+
+def test_disk_tier_survives_restart_and_uses_wal(tmp_path):
+    path = str(tmp_path / "cache.db")
+    ResearchCache(disk_path=path).set("Tesla", "News", "Latest news?", "Deliveries rose")
+    cache = ResearchCache(disk_path=path)
+    assert cache.get("Tesla", "News", "latest news") == "Deliveries rose"
+    assert cache.stats()["disk_hits"] == 1
+    assert cache._disk_conn().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_disk_tier_keeps_one_connection_per_thread(tmp_path):
+    cache = ResearchCache(disk_path=str(tmp_path / "cache.db"))
+    conns = []
+
+    def work():
+        for i in range(20):
+            cache.set("Tesla", "News", f"question {threading.get_ident()} {i}", "answer")
+        conns.append(cache._disk_conn())
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(c) for c in conns}) == 4
+    assert cache._disk_conn() is cache._disk_conn()
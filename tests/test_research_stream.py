@@ -0,0 +1,46 @@
+import threading
+import time
+
+import groq_client
+import research
+from research_cache import ResearchCache
+
+
+def test_concurrent_streams_share_one_groq_call(monkeypatch):
+    calls = []
+
+    def fake_stream(prompt):
+        calls.append(prompt)
+        for token in ("Revenue ", "grew ", "12%."):
+            time.sleep(0.05)
+            yield token
+
+    monkeypatch.setattr(groq_client, "stream", fake_stream)
+    monkeypatch.setattr(research, "research_cache", ResearchCache(disk_path=""))
+    received = {}
+
+    def ask(name):
+        tokens = received[name] = []
+        received[name + "_result"] = research.stream_answer("Tesla", "Financials", "Revenue growth?", tokens.append)
+
+    threads = [threading.Thread(target=ask, args=(name,)) for name in ("leader", "follower")]
+    threads[0].start()
+    time.sleep(0.02)
+    threads[1].start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert received["leader"] == ["Revenue ", "grew ", "12%."]
+    assert received["follower"] == ["Revenue grew 12%."]
+    assert received["follower_result"] == ("Revenue grew 12%.", True, False)
+
+
+def test_stream_failure_returns_error_text(monkeypatch):
+    def failing_stream(prompt):
+        raise RuntimeError("[Groq API error 503]")
+        yield
+
+    monkeypatch.setattr(groq_client, "stream", failing_stream)
+    assert research.stream_answer("Tesla", "News", "Anything new?", lambda t: None) == \
+        ("[Groq API error 503]", False, False)
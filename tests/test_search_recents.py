@@ -0,0 +1,28 @@
+from db import execute
+from models import assign_legacy_rows, init_db, save_recent, search_recents
+
+
+def test_snippets_escape_stored_html():
+    init_db()
+    execute('DELETE FROM recents')
+    save_recent("Tesla", "News", "<img src=x onerror=alert(1)> tesla margins",
+                "<script>alert(2)</script> margins fell", "alice")
+    (row,) = search_recents("alice", "margins")
+    prompt_snippet, response_snippet = row[3], row[4]
+    assert "<img" not in prompt_snippet and "&lt;img src=x onerror=alert(1)&gt;" in prompt_snippet
+    assert "<script>" not in response_snippet
+    assert "<mark>margins</mark>" in prompt_snippet and "<mark>margins</mark>" in response_snippet
+    assert search_recents("bob", "margins") == []
+
+
+def test_search_only_ranks_the_owners_rows():
+    init_db()
+    execute('DELETE FROM recents')
+    uid = "6f1c2a4e-0d3b-4a51-9d7e-2b8c1f0a9e33"
+    save_recent("Tesla", "News", "tesla margins", "margins fell", "6f1c2a4e-0d3b-4a51-9d7e-2b8c1f0a9e34")
+    save_recent("Tesla", "News", "tesla margins today", "margins rose", None)
+    assert search_recents(uid, "margins") == []
+    # Handing legacy rows to a user re-indexes them under the new owner
+    assign_legacy_rows(uid)
+    (row,) = search_recents(uid, "margins")
+    assert "<mark>margins</mark>" in row[4] and "rose" in row[4]
@@ -0,0 +1,37 @@
+from http.server import BaseHTTPRequestHandler
+
+from serving import PooledHTTPServer
+
+
+def _server(workers, upstream_workers):
+    return PooledHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler,
+                            workers=workers, upstream_workers=upstream_workers,
+                            bind_and_activate=False)
+
+
+def test_keepalive_leaves_reserved_worker_free():
+    httpd = _server(workers=4, upstream_workers=2)
+    httpd._inflight = 1
+    assert httpd.has_spare_workers()
+    # Two idle connections would leave nothing once both upstream slots fill
+    httpd._inflight = 2
+    assert not httpd.has_spare_workers()
+
+
+def test_keepalive_does_not_count_upstream_calls_as_parked():
+    httpd = _server(workers=4, upstream_workers=2)
+    assert httpd.try_acquire_upstream_slot()
+    assert httpd.try_acquire_upstream_slot()
+    httpd._inflight = 3
+    # One connection outside the upstream calls; it may stay open
+    assert httpd.has_spare_workers()
+    # An upstream request's own connection goes idle once it answers
+    assert not httpd.has_spare_workers(holding_upstream=True)
+    httpd.release_upstream_slot()
+    httpd.release_upstream_slot()
+
+
+def test_single_spare_worker_never_keeps_alive():
+    httpd = _server(workers=2, upstream_workers=1)
+    httpd._inflight = 1
+    assert not httpd.has_spare_workers()
@@ -0,0 +1,19 @@
+import os
+
+from server import static_files
+
+
+def test_bench_results_and_tests_are_not_served():
+    assert static_files.resolve('/bench/results/run.json') is None
+    assert static_files.resolve('/static/../bench/results/run.json') is None
+    assert static_files.resolve('/tests/conftest.py') is None
+    assert static_files.resolve('/index.html') is not None
+
+
+def test_only_frontend_files_are_served():
+    assert static_files.resolve('/requirements.txt') is None
+    assert static_files.resolve('/test_output.txt') is None
+    assert static_files.resolve('/research.html') is not None
+    assert static_files.resolve('/static/app.js') is not None
+    assets = os.listdir(os.path.join(static_files.root, 'static'))
+    assert static_files.preload() == len(static_files.pages) + len(assets)
@@ -0,0 +1,76 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from upstream import UpstreamClient
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    calls = []
+    plan = []  # per call: a status to send, or "slow" to outlast the read timeout
+
+    def _handle(self):
+        _Upstream.calls.append(self.command)
+        step = _Upstream.plan.pop(0) if _Upstream.plan else 200
+        if step == "slow":
+            time.sleep(0.6)
+            step = 200
+        self.send_response(step)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._handle()
+
+    do_GET = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Upstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    _Upstream.calls.clear()
+    _Upstream.plan = []
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+def _client(**kwargs):
+    return UpstreamClient("test", read_timeout=0.2, backoff_base=0.01, **kwargs)
+
+
+def test_post_read_timeout_is_not_resent(upstream):
+    _Upstream.plan = ["slow"]
+    with pytest.raises(requests.Timeout):
+        _client().post(upstream, json={})
+    assert _Upstream.calls == ["POST"]
+
+
+def test_post_retries_unprocessed_statuses_only(upstream):
+    _Upstream.plan = [503, 200]
+    assert _client().post(upstream, json={}).status_code == 200
+    _Upstream.plan = [500, 200]
+    assert _client().post(upstream, json={}).status_code == 500
+    assert _Upstream.calls == ["POST"] * 3
+
+
+def test_get_read_timeout_is_retried(upstream):
+    _Upstream.plan = ["slow", 200]
+    assert _client().get(upstream).status_code == 200
+    assert _Upstream.calls == ["GET", "GET"]
+
+
+def test_retries_stop_at_the_deadline(upstream):
+    _Upstream.plan = ["slow"] * 5
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        _client(max_retries=5, deadline=0.5).get(upstream)
+    assert time.monotonic() - started < 1.0
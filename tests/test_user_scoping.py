@@ -0,0 +1,48 @@
+import pytest
+
+import research
+from db import query
+from models import save_recent, latest_answer
+from recents_compactor import trim_companies
+
+
+pytestmark = pytest.mark.usefixtures("empty_recents")
+
+
+def test_latest_answer_is_per_user():
+    save_recent("Tesla", "News", "I am divorcing, should I dump my 5000 TSLA?", "Private advice", "alice")
+    assert latest_answer("alice", "Tesla", "News")[0] == "Private advice"
+    assert latest_answer("bob", "Tesla", "News") is None
+
+
+def test_stale_fallback_never_returns_another_users_answer(monkeypatch):
+    save_recent("Tesla", "News", "I am divorcing, should I dump my 5000 TSLA?", "Private advice", "alice")
+    monkeypatch.setattr(research, "_ask_groq", lambda company, tab, question: ("[Groq API error 503]", False))
+    answer, ok, cached, answered_at = research.answer_question("Tesla", "News", "Latest Tesla news?", "bob")
+    assert (answer, ok, answered_at) == ("[Groq API error 503]", False, None)
+    answer, ok, cached, answered_at = research.answer_question("Tesla", "News", "Latest Tesla news?", "alice")
+    assert answer == "Private advice" and answered_at and not ok
+
+
+def test_similar_question_only_matches_own_history():
+    save_recent("Tesla", "Financials", "What is Tesla revenue growth?", "Alice's answer", "alice")
+    assert research.cached_answer("Tesla", "Financials", "Tesla revenue growth", "bob") is None
+    assert research.cached_answer("Tesla", "Financials", "Tesla revenue growth", "alice")[0] == "Alice's answer"
+    # Alice's match must not reach Bob through the shared exact-match cache either
+    assert research.cached_answer("Tesla", "Financials", "Tesla revenue growth", "bob") is None
+
+
+def test_trim_keeps_each_users_newest_rows():
+    for i in range(5):
+        save_recent("Tesla", "News", f"heavy question {i}", "answer", "heavy")
+    save_recent("Tesla", "News", "light question", "answer", "light")
+    assert trim_companies(2) == 3
+    assert latest_answer("light", "Tesla", "News") is not None
+
+
+def test_recents_filters_walk_per_user_indexes():
+    indexes = {r[0] for r in query("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'recents'")}
+    assert not indexes & {'idx_recents_company_id', 'idx_recents_tab_id', 'idx_recents_company_tab_id'}
+    plan = query('EXPLAIN QUERY PLAN SELECT id FROM recents WHERE user_id = ? AND tab = ? ORDER BY id DESC',
+                 ('alice', 'News'))
+    assert 'idx_recents_user_tab_id' in plan[0][3]
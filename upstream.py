@@ -0,0 +1,169 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from metrics import upstream_latency
+
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3.05"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "8"))
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "16"))
+# Seconds one request may spend across all its attempts and backoffs
+UPSTREAM_RETRY_DEADLINE = float(os.getenv("UPSTREAM_RETRY_DEADLINE", "45"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Methods that are safe to send twice. Anything else (a Groq completion POST) is
+# resent only when it cannot have been processed: the connection never opened,
+# or the server answered 429/503 without doing the work.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+UNPROCESSED_STATUSES = {429, 503}
+LATENCY_SAMPLES = 512
+
+_clients = {}
+
+
+def _retry_after_seconds(response):
+    """Parse a Retry-After header (delta-seconds or HTTP-date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _never_sent(exc):
+    """True if a requests exception happened while connecting, before any bytes were sent."""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+class UpstreamClient:
+    """Keep-alive session for one upstream host with retries and latency stats."""
+
+    def __init__(self, name, read_timeout, connect_timeout=UPSTREAM_CONNECT_TIMEOUT,
+                 max_retries=UPSTREAM_MAX_RETRIES, pool_size=UPSTREAM_POOL_SIZE,
+                 backoff_base=UPSTREAM_BACKOFF_BASE, backoff_max=UPSTREAM_BACKOFF_MAX,
+                 deadline=UPSTREAM_RETRY_DEADLINE):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._stats = {'requests': 0, 'errors': 0, 'retries': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+        self._status_counts = {}
+        _clients[name] = self
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request, retrying connection errors and 429/5xx responses with
+        jittered exponential backoff (or the server's Retry-After when given).
+        Non-idempotent methods are retried only on connect failures and
+        429/503. No attempt starts, and no read waits, past `deadline` seconds
+        from the first. The last response is returned as-is; the last
+        exception is re-raised.
+        """
+        timeout = kwargs.pop("timeout", self.timeout)
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            remaining = max(0.1, deadline - time.monotonic())
+            timeout = (min(connect_timeout, remaining), min(read_timeout, remaining))
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(time.perf_counter() - started, None)
+                if attempt >= self.max_retries or not (idempotent or _never_sent(e)):
+                    raise
+                delay = self._backoff(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise
+            else:
+                self._record(time.perf_counter() - started, response.status_code)
+                if response.status_code not in retry_statuses or attempt >= self.max_retries:
+                    return response
+                delay = _retry_after_seconds(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                elif delay > self.backoff_max:
+                    # Server asked us to wait longer than we are willing to hold the request
+                    return response
+                if time.monotonic() + delay >= deadline:
+                    return response
+                response.close()
+
+            attempt += 1
+            with self._lock:
+                self._stats['retries'] += 1
+            time.sleep(delay)
+
+    def _backoff(self, attempt):
+        # "Full jitter": uniform between 0 and the capped exponential step
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _record(self, seconds, status):
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['total_seconds'] += seconds
+            self._stats['max_seconds'] = max(self._stats['max_seconds'], seconds)
+            if status is None or status >= 500 or status == 429:
+                self._stats['errors'] += 1
+            key = str(status) if status is not None else 'connection_error'
+            self._status_counts[key] = self._status_counts.get(key, 0) + 1
+            self._latencies.append(seconds)
+        upstream_latency.observe(seconds, upstream=self.name, status=key)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['statuses'] = dict(self._status_counts)
+            samples = sorted(self._latencies)
+        count = stats['requests']
+        stats['avg_seconds'] = round(stats['total_seconds'] / count, 4) if count else 0.0
+        for label, q in (('p50_seconds', 0.50), ('p95_seconds', 0.95), ('p99_seconds', 0.99)):
+            stats[label] = round(samples[min(len(samples) - 1, int(q * len(samples)))], 4) if samples else 0.0
+        stats['total_seconds'] = round(stats['total_seconds'], 4)
+        stats['max_seconds'] = round(stats['max_seconds'], 4)
+        return stats
+
+
+def all_stats():
+    return {name: client.stats() for name, client in _clients.items()}
+
+
+groq_http = UpstreamClient("groq", read_timeout=float(os.getenv("GROQ_READ_TIMEOUT", "40")))
+newsapi_http = UpstreamClient("newsapi", read_timeout=float(os.getenv("NEWSAPI_READ_TIMEOUT", "20")))
@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+GROQ_CONCURRENCY_INITIAL = int(os.getenv("GROQ_CONCURRENCY_INITIAL", "8"))
+GROQ_CONCURRENCY_MIN = int(os.getenv("GROQ_CONCURRENCY_MIN", "2"))
+GROQ_CONCURRENCY_MAX = int(os.getenv("GROQ_CONCURRENCY_MAX", "32"))
+# A call slower than this counts as a sign of overload, like an error
+GROQ_SLOW_SECONDS = float(os.getenv("GROQ_SLOW_SECONDS", "15"))
+GROQ_QUEUE_MAX = int(os.getenv("GROQ_QUEUE_MAX", "64"))
+GROQ_QUEUE_TIMEOUT = float(os.getenv("GROQ_QUEUE_TIMEOUT", "5"))
+GROQ_BREAKER_WINDOW = float(os.getenv("GROQ_BREAKER_WINDOW", "30"))
+GROQ_BREAKER_MIN_CALLS = int(os.getenv("GROQ_BREAKER_MIN_CALLS", "10"))
+GROQ_BREAKER_ERROR_RATE = float(os.getenv("GROQ_BREAKER_ERROR_RATE", "0.5"))
+GROQ_BREAKER_COOLDOWN = float(os.getenv("GROQ_BREAKER_COOLDOWN", "30"))
+
+_guards = {}
+
+
+class UpstreamUnavailable(RuntimeError):
+    """Raised instead of calling the upstream: breaker open or no slot before the deadline."""
+
+    def __init__(self, upstream, reason, retry_after=None):
+        super().__init__(f"[{upstream.capitalize()} temporarily unavailable: {reason.replace('_', ' ')}]")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdaptiveLimit:
+    """
+    In-flight limit adjusted by AIMD: each fast success while the limit is in
+    use adds 1/limit, an error or slow call multiplies it by `backoff`. Only
+    calls started after the last cut can cut again, so one burst of failures
+    shrinks the limit once rather than once per failed call.
+    """
+
+    def __init__(self, initial, minimum, maximum, slow_after, max_waiting, backoff=0.7):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(maximum, initial)))
+        self.slow_after = slow_after
+        self.max_waiting = max_waiting
+        self.backoff = backoff
+        self.inflight = 0
+        self.waiting = 0
+        self._last_cut = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout):
+        """Wait up to timeout seconds for a slot. Returns None, 'queue_full' or 'queue_timeout'."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self.inflight < int(self.limit):
+                self.inflight += 1
+                return None
+            if self.waiting >= self.max_waiting:
+                return 'queue_full'
+            self.waiting += 1
+            try:
+                while self.inflight >= int(self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return 'queue_timeout'
+                    self._cond.wait(remaining)
+                self.inflight += 1
+                return None
+            finally:
+                self.waiting -= 1
+
+    def release(self, started, outcome, elapsed=None):
+        """
+        outcome: 'success', 'failure', or None to free the slot without adapting.
+        elapsed defaults to the time since started.
+        """
+        now = time.monotonic()
+        if elapsed is None:
+            elapsed = now - started
+        with self._cond:
+            in_use = self.inflight >= int(self.limit) * 0.5
+            self.inflight -= 1
+            if outcome == 'failure' or (outcome == 'success' and elapsed > self.slow_after):
+                if started >= self._last_cut:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_cut = now
+            elif outcome == 'success' and in_use:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify()
+
+
+class CircuitBreaker:
+    """
+    Opens when at least min_calls finished in the last `window` seconds and
+    the failing fraction reaches error_rate. After `cooldown` one probe call is
+    let through (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, window, min_calls, error_rate, cooldown):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._events = deque()  # (monotonic time, failed)
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        with self._lock:
+            if self.state != 'open':
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self.state = 'half_open'
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record(self, failed):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == 'half_open':
+                self._probing = False
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = 'closed'
+                    self._events.clear()
+                    self._failures = 0
+                return
+            if self.state == 'open':
+                # Late result of a call started before the breaker opened
+                return
+            self._events.append((now, failed))
+            self._failures += failed
+            while self._events and now - self._events[0][0] > self.window:
+                self._failures -= self._events.popleft()[1]
+            if len(self._events) >= self.min_calls and self._failures / len(self._events) >= self.error_rate:
+                self._open(now)
+
+    def _open(self, now):
+        self.state = 'open'
+        self.opened += 1
+        self._opened_at = now
+        self._events.clear()
+        self._failures = 0
+
+    def error_rate_now(self):
+        with self._lock:
+            return round(self._failures / len(self._events), 3) if self._events else 0.0
+
+
+class _Slot:
+    __slots__ = ('outcome', 'elapsed')
+
+    def __init__(self):
+        # Stays 'failure' if the call raises before reporting
+        self.outcome = 'failure'
+        # Latency judged by the limiter; streams set it to the time to first byte
+        self.elapsed = None
+
+
+class UpstreamGuard:
+    """Adaptive concurrency limit, bounded wait queue and circuit breaker for one upstream."""
+
+    def __init__(self, name, limit, breaker, queue_timeout):
+        self.name = name
+        self.limit = limit
+        self.breaker = breaker
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'failures': 0, 'circuit_open': 0, 'queue_full': 0, 'queue_timeout': 0}
+        _guards[name] = self
+
+    def _reject(self, reason, retry_after=None):
+        with self._lock:
+            self._stats[reason] += 1
+        raise UpstreamUnavailable(self.name, reason, retry_after)
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold a slot for one upstream call. Raises UpstreamUnavailable without
+        calling out when the breaker is open or no slot frees up within
+        queue_timeout. Set slot.outcome to 'success', 'failure' (overload:
+        429/5xx/timeouts) or None (a response that says nothing about load).
+        """
+        if self.breaker.state == 'open' and self.breaker.retry_after() > 0:
+            self._reject('circuit_open', self.breaker.retry_after())
+        rejected = self.limit.acquire(self.queue_timeout)
+        if rejected:
+            self._reject(rejected, 1)
+        if not self.breaker.allow():
+            self.limit.release(time.monotonic(), None)
+            self._reject('circuit_open', self.breaker.retry_after())
+
+        slot = _Slot()
+        started = time.monotonic()
+        try:
+            yield slot
+        finally:
+            self.limit.release(started, slot.outcome, slot.elapsed)
+            self.breaker.record(slot.outcome == 'failure')
+            with self._lock:
+                self._stats['calls'] += 1
+                self._stats['failures'] += slot.outcome == 'failure'
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(
+            state=self.breaker.state,
+            error_rate=self.breaker.error_rate_now(),
+            breaker_opened=self.breaker.opened,
+            limit=round(self.limit.limit, 2),
+            inflight=self.limit.inflight,
+            waiting=self.limit.waiting,
+        )
+        return stats
+
+
+def all_stats():
+    return {name: guard.stats() for name, guard in _guards.items()}
+
+
+groq_guard = UpstreamGuard(
+    "groq",
+    AdaptiveLimit(GROQ_CONCURRENCY_INITIAL, GROQ_CONCURRENCY_MIN, GROQ_CONCURRENCY_MAX,
+                  GROQ_SLOW_SECONDS, GROQ_QUEUE_MAX),
+    CircuitBreaker(GROQ_BREAKER_WINDOW, GROQ_BREAKER_MIN_CALLS, GROQ_BREAKER_ERROR_RATE, GROQ_BREAKER_COOLDOWN),
+    GROQ_QUEUE_TIMEOUT,
+)